@@ -1,223 +1,168 @@
-import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud
-from collections import Counter
-import numpy as np
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Image, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet
-import io
-from statistics import median, mode, mean
-import pandas as pd
-from collections import defaultdict
-
-DATA_FILE = "OEPS_data.json"
-
-STOP_WORDS = set([
-    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'he',
-    'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the', 'to', 'was', 'were', 'will',
-    'with', 'i', 'you', 'your', 'we', 'they', 'them', 'their', 'this', 'these', 'those',
-    'am', 'have', 'had', 'do', 'does', 'did', 'but', 'or', 'not', 'no', 'so', 'what', 'which'
-])
+import OEPS_Storage
+import OEPS_Rollups
+import OEPS_Notes
+import OEPS_Parquet
+import OEPS_Profiling
+import OEPS_Window
+from OEPS_Profiling import stage
 
-def load_data():
-    with open(DATA_FILE, 'r') as file:
-        return json.load(file)
-
-def filter_data_by_date_range(data, start_date, end_date):
-    return [entry for entry in data if start_date <= datetime.fromisoformat(entry['date']) <= end_date]
-
-import pandas as pd
+# pandas, matplotlib, wordcloud, reportlab and OEPS_Calibration (numpy) are
+# imported inside the functions that need them, so importing this module
+# (e.g. from the OEPS_main menu) stays cheap until a report is actually built
 
-def generate_score_trend_visualization(filtered_data):
-    # Convert data to pandas DataFrame
-    df = pd.DataFrame([(datetime.fromisoformat(entry['date']), entry['total score']) for entry in filtered_data],
-                      columns=['date', 'score'])
-    
-    # Resample data to monthly averages
-    monthly_avg = df.set_index('date').resample('QE')['score'].mean()
-    
-    # Create the plot
-    plt.figure(figsize=(12, 6))
-    plt.plot(monthly_avg.index, monthly_avg.values, marker='o')
-    plt.title('Average Scores by Quarter')
-    plt.xlabel('Date')
-    plt.ylabel('Average Total Score')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    
-    # Add value labels on the points
-    for x, y in zip(monthly_avg.index, monthly_avg.values):
-        plt.annotate(f'{y:.2f}', (x, y), textcoords="offset points", xytext=(0,10), ha='center')
-    
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    plt.close()
-    
-    return ('Average Monthly Scores Over Time', img_buffer)
+# Academic years run from August through July
+ACADEMIC_YEAR_START_MONTH = 8
 
-def generate_temporal_analysis(filtered_data):
-    exam_dates = [datetime.fromisoformat(entry['date']) for entry in filtered_data]
-    
-    # Aggregate by quarter
-    exams_per_quarter = defaultdict(int)
-    for date in exam_dates:
-        quarter = f"{date.year} Q{(date.month-1)//3 + 1}"
-        exams_per_quarter[quarter] += 1
-    
-    # Sort quarters chronologically
-    sorted_quarters = sorted(exams_per_quarter.items(), key=lambda x: datetime.strptime(x[0], "%Y Q%m"))
-    
-    # Calculate overall trend
-    if len(sorted_quarters) > 1:
-        first_half = sum(count for _, count in sorted_quarters[:len(sorted_quarters)//2])
-        second_half = sum(count for _, count in sorted_quarters[len(sorted_quarters)//2:])
-        trend = "Increasing" if second_half > first_half else "Decreasing"
-    else:
-        trend = "Not enough data to determine trend"
-    
-    # Find the busiest quarter
-    busiest_quarter = max(exams_per_quarter, key=exams_per_quarter.get)
-    
-    return {
-        "quarters": sorted_quarters,
-        "trend": trend,
-        "busiest_quarter": busiest_quarter,
-        "busiest_quarter_count": exams_per_quarter[busiest_quarter]
+def load_data():
+    return OEPS_Storage.load_data()
+
+def load_data_in_range(start_date, end_date):
+    # Stream only the requested window from the date-sorted store
+    return OEPS_Storage.iter_range(start_date, end_date)
+
+# Titles of the charts shown after the EAP page, in report order
+VISUALIZATION_TITLES = [
+    'Band Distribution',
+    'Average Monthly Scores Over Time',
+    'Average Scores by Question',
+    'Examiner Notes Word Cloud',
+    'Common Words in Notes',
+    'Score Distribution by Examiner',
+]
+
+def build_chart_jobs(stats):
+    # Reduce the statistics to the plain data each chart needs, keyed by title
+    quarterly_avg = stats['quarterly_avg']
+
+    # Word cloud and common words of examiner notes (stop words removed)
+    word_counts = stats['word_counts']
+    common_words = OEPS_Notes.top_words(word_counts, 10)
+
+    quarters, counts = zip(*stats['quarters'])
+    examiner_stats = stats['examiner_stats']
+
+    jobs = {
+        'Band Distribution': ('pie_chart', {
+            'title': 'Distribution of Bands',
+            'labels': list(stats['band_counts'].keys()),
+            'values': list(stats['band_counts'].values())}),
+        'Average Monthly Scores Over Time': ('score_trend', {
+            'dates': quarterly_avg.index.to_pydatetime().tolist(),
+            'values': quarterly_avg.tolist()}),
+        'Average Scores by Question': ('question_averages', {
+            'avg_scores': stats['avg_question_scores']}),
+        'Examiner Notes Word Cloud': ('word_cloud', {
+            'frequencies': dict(word_counts)}),
+        'Common Words in Notes': ('common_words', {
+            'words': [word for word, count in common_words],
+            'counts': [count for word, count in common_words]}),
+        'Score Distribution by Examiner': ('examiner_boxplot', {
+            'examiners': list(examiner_stats.keys()),
+            'stats': list(examiner_stats.values())}),
+        'Number of Exams per Quarter': ('quarterly_counts', {
+            'quarters': list(quarters),
+            'counts': list(counts)}),
+        'EAP Requirements Distribution': ('pie_chart', {
+            'title': 'EAP Requirements Distribution',
+            'labels': list(stats['eap_counts'].keys()),
+            'values': list(stats['eap_counts'].values())}),
     }
+    if 'calibration' in stats:
+        # Examiners that have other examiners to be compared with
+        rows = [row for row in stats['calibration']['examiners'] if row['severity_ci'] is not None]
+        jobs['Examiner Severity'] = ('examiner_severity', {
+            'examiners': [row['examiner'] for row in rows],
+            'severity': [row['severity'] for row in rows],
+            'lows': [row['severity_ci'][0] for row in rows],
+            'highs': [row['severity_ci'][1] for row in rows],
+            'flagged': [row['flagged'] for row in rows]})
+    return jobs
 
 # Helper function to create report visualizations
-def generate_visualizations(filtered_data):
-    visualizations = []
-
-    # Pie chart of band distribution
-    plt.figure(figsize=(8, 6))
-    band_counts = Counter(entry['band'] for entry in filtered_data)
-    plt.pie(band_counts.values(), labels=band_counts.keys(), autopct='%1.1f%%')
-    plt.title('Distribution of Bands')
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    visualizations.append(('Band Distribution', img_buffer))
-    plt.close()
-
-    # Score trends over time
-    score_trend_vis = generate_score_trend_visualization(filtered_data)
-    visualizations.append(score_trend_vis)
-
-    # Bar chart of average scores by question
-    question_scores = [[], [], []]
-    for entry in filtered_data:
-        for i, question in enumerate(entry['questions']):
-            question_scores[i].append(question['question score'])
-
-    avg_scores = [sum(scores) / len(scores) if scores else 0 for scores in question_scores]
-
-    plt.figure(figsize=(10, 6))
-    bars = plt.bar(['Question 1', 'Question 2', 'Question 3'], avg_scores)
-    plt.title('Average Scores by Question Type')
-    plt.ylabel('Average Score')
-    plt.ylim(0, 3)  # Set y-axis limit from 0 to 3
-
-    for bar in bars:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height,
-                 f'{height:.2f}',
-                 ha='center', va='bottom')
-
-    plt.tight_layout()
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    visualizations.append(('Average Scores by Question', img_buffer))
-    plt.close()
-
-    # Word cloud of examiner notes
-    all_notes = ' '.join([note for entry in filtered_data for question in entry['questions'] for note in question['notes']])
-    words = [word.lower() for word in all_notes.split() if word.lower() not in STOP_WORDS and len(word) > 3]
-    filtered_text = ' '.join(words)
-    
-    wordcloud = WordCloud(width=800, height=400, background_color='white').generate(filtered_text)
-    plt.figure(figsize=(10, 5))
-    plt.imshow(wordcloud, interpolation='bilinear')
-    plt.axis('off')
-    plt.title('Word Cloud of Examiner Notes (Stop Words Removed)')
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    visualizations.append(('Examiner Notes Word Cloud', img_buffer))
-    plt.close()
-
-    # Common words
-    common_words = Counter(words).most_common(10)
-    
-    plt.figure(figsize=(10, 5))
-    plt.bar([word for word, count in common_words], [count for word, count in common_words])
-    plt.title('Top 10 Most Common Words in Examiner Notes (Stop Words Removed)')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    visualizations.append(('Common Words in Notes', img_buffer))
-    plt.close()
-
-    # Scoring by examiner
-    examiner_scores = {}
-    for entry in filtered_data:
-        examiner = entry['examiner']
-        score = entry['total score']
-        if examiner not in examiner_scores:
-            examiner_scores[examiner] = []
-        examiner_scores[examiner].append(score)
-
-    plt.figure(figsize=(12, 6))
-    plt.boxplot(examiner_scores.values(), tick_labels=examiner_scores.keys())
-    plt.title('Score Distribution by Examiner')
-    plt.xlabel('Examiner')
-    plt.ylabel('Total Score')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    visualizations.append(('Score Distribution by Examiner', img_buffer))
-    plt.close()
-    
-    return visualizations, examiner_scores
-
-# Helper function to generate visualizations of the EAP requirement data
-def generate_eap_requirement_visualization(filtered_data):
-    # Count EAP requirements
-    eap_counts = Counter(entry['EAP requirement'] for entry in filtered_data)
-    
-    # Create pie chart
-    plt.figure(figsize=(8, 6))
-    plt.pie(eap_counts.values(), labels=eap_counts.keys(), autopct='%1.1f%%')
-    plt.title('EAP Requirements Distribution')
-    
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    plt.close()
-    
-    return img_buffer
+def generate_visualizations(stats, workers=None, use_cache=True, chart_format=None):
+    # Render every chart concurrently (or serve it from the chart cache);
+    # the PDF build only assembles them. chart_format is 'svg' (drawn as
+    # vector graphics) or 'png', by default svg when svglib is installed.
+    import OEPS_Charts
+    chart_format = chart_format or OEPS_Charts.default_format()
+    with stage("build_chart_jobs"):
+        jobs = build_chart_jobs(stats)
+    images = OEPS_Charts.render_charts(list(jobs.values()), workers, use_cache, chart_format)
+    return dict(zip(jobs, images))
 
 # Helper function to generate a report, will call other functions
-def create_report(start_date, end_date):
-    data = load_data()
-    filtered_data = filter_data_by_date_range(data, start_date, end_date)
-    visualizations, examiner_scores = generate_visualizations(filtered_data)
-    temporal_data = generate_temporal_analysis(filtered_data)
-    
-    if not filtered_data:
-        print(f"No data available for the selected period.")
-        return
-
-    doc = SimpleDocTemplate(f"ITA_Report_{start_date.date()}_to_{end_date.date()}.pdf", pagesize=landscape(letter))
+def compute_report_stats(start_date, end_date, use_rollups=True, rollups=None, exact=False):
+    # exact: scan the raw entries and compute examiner statistics from the
+    # raw scores instead of combining rollup sketches
+    with stage("import OEPS_Aggregation"):
+        import OEPS_Aggregation
+    if use_rollups and not exact:
+        # Combine the stored quarterly rollups; only partial quarters at the
+        # edges of the window are read from the raw entries
+        window = OEPS_Window.load_window()
+        if window is not None and OEPS_Window.period(window) == (start_date, end_date):
+            # The rolling 365-day window keeps its own quarterly rollups
+            quarters = window["quarters"]
+        else:
+            with stage("window_rollups"):
+                quarters = OEPS_Rollups.window_rollups(start_date, end_date, rollups)
+        if not any(q['count'] for q in quarters.values()):
+            return None
+        with stage("summarize_rollups"):
+            return OEPS_Aggregation.summarize_rollups(quarters)
+    # One frame holds every statistic and chart input: read from the Parquet
+    # mirror with the date range pushed down to the files when it has been
+    # exported, otherwise built in one streaming scan of the entries
+    if OEPS_Parquet.is_current():
+        with stage("read Parquet mirror"):
+            frame, word_counts = OEPS_Parquet.read_frame(start_date, end_date)
+    else:
+        with stage("load, filter and build frame"):
+            frame, word_counts = OEPS_Aggregation.build_frame(load_data_in_range(start_date, end_date))
+    if frame.empty:
+        return None
+    with stage("summarize"):
+        return OEPS_Aggregation.summarize(frame, word_counts, True if exact else None)
+
+def create_report(start_date, end_date, workers=None, use_cache=True, use_rollups=True, rollups=None, exact=False,
+                  chart_format=None, calibration=False):
+    # calibration: add the examiner calibration page and write it as a JSON
+    # file beside the report; the bootstrap is only run when asked for
+    with stage("compute_report_stats"):
+        stats = compute_report_stats(start_date, end_date, use_rollups, rollups, exact)
+    if not stats:
+        print(f"No data available for the selected period ({start_date.date()} to {end_date.date()}).")
+        return None
+
+    if calibration:
+        # Examiner severity and drift with bootstrap intervals
+        import OEPS_Calibration
+        with stage("calibrate examiners"):
+            stats['calibration'] = OEPS_Calibration.calibrate(stats['examiner_quarters'], workers=workers)
+            OEPS_Calibration.write_calibration(OEPS_Calibration.calibration_filename(start_date, end_date),
+                                               stats['calibration'], start_date, end_date)
+
+    with stage("generate_visualizations"):
+        visualizations = generate_visualizations(stats, workers, use_cache, chart_format)
+    with stage("build_report_pdf"):
+        build_report_pdf(start_date, end_date, stats, visualizations)
+    print(f"Report generated: {report_filename(start_date, end_date)}")
+    return report_filename(start_date, end_date)
+
+def report_filename(start_date, end_date):
+    return f"ITA_Report_{start_date.date()}_to_{end_date.date()}.pdf"
+
+def build_report_pdf(start_date, end_date, stats, visualizations):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, PageBreak, KeepTogether
+    from reportlab.lib.styles import getSampleStyleSheet
+    from OEPS_Charts import chart_flowable
+
+    doc = SimpleDocTemplate(report_filename(start_date, end_date), pagesize=landscape(letter))
     elements = []
     styles = getSampleStyleSheet()
 
@@ -225,32 +170,17 @@ def create_report(start_date, end_date):
     elements.append(Paragraph(f"ITA Assessment Report - {start_date.date()} to {end_date.date()}", styles['Title']))
 
     # Basic statistics
-    total_exams = len(filtered_data)
-    
-    # Band breakdown
-    band_counts = Counter(entry['band'] for entry in filtered_data)
-    pass_rate = sum(band_counts[band] for band in ['Low Pass', 'High Pass']) / total_exams if total_exams > 0 else 0
-    
-    # Score statistics
-    scores = [entry['total score'] for entry in filtered_data]
-    avg_score = mean(scores) if scores else 0
-    median_score = median(scores) if scores else 0
-    min_score = min(scores) if scores else 0
-    max_score = max(scores) if scores else 0
-    
-    # Question-specific statistics
-    question_scores = [[], [], []]
-    for entry in filtered_data:
-        for i, question in enumerate(entry['questions']):
-            question_scores[i].append(question['question score'])
-    avg_question_scores = [mean(scores) if scores else 0 for scores in question_scores]
-    
-    # EAP Requirement summary
-    eap_counts = Counter(entry['EAP requirement'] for entry in filtered_data)
-    
-    # Examiner statistics
-    examiners = set(entry['examiner'] for entry in filtered_data)
-    exams_per_examiner = total_exams / len(examiners) if examiners else 0
+    total_exams = stats['total_exams']
+    band_counts = stats['band_counts']
+    pass_rate = stats['pass_rate']
+    avg_score = stats['avg_score']
+    median_score = stats['median_score']
+    min_score = stats['min_score']
+    max_score = stats['max_score']
+    avg_question_scores = stats['avg_question_scores']
+    eap_counts = stats['eap_counts']
+    examiner_stats = stats['examiner_stats']
+    exams_per_examiner = stats['exams_per_examiner']
     
     # Add statistics to the report
     elements.append(Paragraph("Summary Statistics", styles['Heading2']))
@@ -274,23 +204,23 @@ def create_report(start_date, end_date):
         elements.append(Paragraph(f"{req}: {count} ({count/total_exams:.2%})", styles['Normal']))
     
     elements.append(Paragraph("Examiner Statistics", styles['Heading3']))
-    elements.append(Paragraph(f"Total Examiners: {len(examiners)}", styles['Normal']))
+    elements.append(Paragraph(f"Total Examiners: {len(examiner_stats)}", styles['Normal']))
     elements.append(Paragraph(f"Average Exams per Examiner: {exams_per_examiner:.2f}", styles['Normal']))
     
     # Examiner scoring analysis
     elements.append(Paragraph("Examiner Scoring Analysis", styles['Heading3']))
-    for examiner, scores in examiner_scores.items():
-        avg_score = mean(scores)
-        elements.append(Paragraph(f"{examiner}: Average Score = {avg_score:.2f}, Number of Exams = {len(scores)}", styles['Normal']))
+    for examiner, box in examiner_stats.items():
+        elements.append(Paragraph(f"{examiner}: Average Score = {box['mean']:.2f}, Median = {box['med']:.2f}, "
+                                  f"Middle Half = {box['q1']:.2f} - {box['q3']:.2f}, Number of Exams = {box['count']}", styles['Normal']))
 
     # Temporal analysis
     elements.append(Paragraph("Temporal Analysis", styles['Heading3']))
-    elements.append(Paragraph(f"Busiest Quarter: {temporal_data['busiest_quarter']} with {temporal_data['busiest_quarter_count']} exams", styles['Normal']))
-    elements.append(Paragraph(f"Overall Trend: {temporal_data['trend']}", styles['Normal']))
+    elements.append(Paragraph(f"Busiest Quarter: {stats['busiest_quarter']} with {stats['busiest_quarter_count']} exams", styles['Normal']))
+    elements.append(Paragraph(f"Overall Trend: {stats['trend']}", styles['Normal']))
 
     # Create a table for the quarterly data
     quarter_data = [["Quarter", "Number of Exams"]]
-    for quarter, count in temporal_data['quarters']:
+    for quarter, count in stats['quarters']:
         quarter_data.append([quarter, str(count)])
 
     quarter_table = Table(quarter_data)
@@ -314,55 +244,150 @@ def create_report(start_date, end_date):
     elements.append(quarter_table)
 
     # Add a visualization of the quarterly data
-    plt.figure(figsize=(12, 6))
-    quarters, counts = zip(*temporal_data['quarters'])
-    plt.bar(quarters, counts)
-    plt.title('Number of Exams per Quarter')
-    plt.xlabel('Quarter')
-    plt.ylabel('Number of Exams')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    plt.close()
-
-    elements.append(Image(img_buffer, width=500, height=300))
+    elements.append(chart_flowable(visualizations['Number of Exams per Quarter'], 500, 300))
 
     elements.append(PageBreak())
 
     # Second page - EAP Requirements
     elements.append(Paragraph("EAP Requirements Analysis", styles['Title']))
     
-    eap_img_buffer = generate_eap_requirement_visualization(filtered_data)
-    elements.append(Image(eap_img_buffer, width=400, height=300))
+    elements.append(chart_flowable(visualizations['EAP Requirements Distribution'], 400, 300))
     
     elements.append(PageBreak())
 
+    # Item analysis: how each prompt in the question bank performed
+    elements.append(Paragraph("Question Prompt Analysis", styles['Title']))
+    elements.append(Paragraph("Difficulty is the average score as a share of the maximum (lower is harder); "
+                              "discrimination is the correlation between the prompt's score and the total score.", styles['Normal']))
+    for slot in sorted({item['slot'] for item in stats['items']}):
+        heading = Paragraph(f"Question {slot}", styles['Heading3'])
+        item_data = [["Prompt", "Exams", "Mean", "Difficulty", "Discrimination", "Scores 0 / 1 / 2 / 3"]]
+        for item in stats['items']:
+            if item['slot'] != slot:
+                continue
+            discrimination = f"{item['discrimination']:.2f}" if item['discrimination'] is not None else "-"
+            shares = " / ".join(f"{item['scores'].get(str(score), 0):.0%}" for score in range(4))
+            item_data.append([Paragraph(item['question'], styles['BodyText']), str(item['count']), f"{item['mean']:.2f}",
+                              f"{item['difficulty']:.2f}", discrimination, shares])
+        item_table = Table(item_data, colWidths=[330, 45, 45, 60, 85, 130], repeatRows=1)
+        item_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        elements.append(KeepTogether([heading, item_table]))
+
+    elements.append(PageBreak())
+
+    # Examiner calibration (see OEPS_Calibration)
+    if 'calibration' in stats:
+        import OEPS_Calibration
+        calibration = stats['calibration']
+        confidence = f"{calibration['confidence']:.0%}"
+        elements.append(Paragraph("Examiner Calibration", styles['Title']))
+        elements.append(Paragraph(
+            f"Severity is the other examiners' average score minus the examiner's own, so a positive severity means "
+            f"harsher than the others. Drift is the change in severity since the examiner's previous quarter. "
+            f"Intervals are {confidence} bootstrap intervals from {calibration['samples']} resamples; rows are highlighted "
+            f"when the severity interval excludes zero with at least {calibration['min_exams']} exams behind it.", styles['Normal']))
+        calibration_data = [["Examiner", "Exams", "Mean", "Severity", f"{confidence} Interval", "Latest Quarter", "Drift",
+                             f"{confidence} Interval", "Drift Flags"]]
+        highlighted = []
+        for row in calibration['examiners']:
+            drift = OEPS_Calibration.latest_drift(row)
+            calibration_data.append([
+                row['examiner'], str(row['count']), f"{row['mean']:.2f}",
+                "-" if row['severity'] is None else f"{row['severity']:+.3f}",
+                "-" if row['severity_ci'] is None else f"{row['severity_ci'][0]:+.3f} to {row['severity_ci'][1]:+.3f}",
+                row['quarters'][-1]['quarter'],
+                "-" if drift is None else f"{drift['drift']:+.3f} ({drift['quarter']})",
+                "-" if drift is None or drift['drift_ci'] is None else f"{drift['drift_ci'][0]:+.3f} to {drift['drift_ci'][1]:+.3f}",
+                str(sum(quarter['drift_flagged'] for quarter in row['quarters']))])
+            if row['flagged']:
+                highlighted.append(('BACKGROUND', (0, len(calibration_data) - 1), (-1, len(calibration_data) - 1), colors.salmon))
+        calibration_table = Table(calibration_data, colWidths=[110, 45, 40, 55, 100, 70, 105, 100, 55], repeatRows=1)
+        calibration_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ] + highlighted))
+        elements.append(calibration_table)
+        if 'Examiner Severity' in visualizations:
+            elements.append(chart_flowable(visualizations['Examiner Severity'], 500, 250))
+        elements.append(PageBreak())
+
     # Remaining visualizations
-    for title, img_buffer in visualizations:
+    for title in VISUALIZATION_TITLES:
         elements.append(Paragraph(title, styles['Heading2']))
-        elements.append(Image(img_buffer, width=500, height=300))
+        elements.append(chart_flowable(visualizations[title], 500, 300))
         elements.append(PageBreak())
 
-    doc.build(elements)
-    print(f"Report generated: ITA_Report_{start_date.date()}_to_{end_date.date()}.pdf")
+    with stage("SimpleDocTemplate.build"):
+        doc.build(elements)
     
+def create_reports(periods, workers=1, use_cache=True, exact=False, chart_format=None, calibration=False):
+    # Headless batch run: the rollups are loaded once and shared by every
+    # period, so overlapping periods reuse the same quarterly aggregates.
+    # With several workers the periods are spread across processes and each
+    # renders its own charts serially.
+    periods = list(dict.fromkeys(periods))
+    rollups = None if exact else OEPS_Rollups.load_or_rebuild()
+    if workers == 1:
+        for start_date, end_date in periods:
+            create_report(start_date, end_date, None, use_cache, True, rollups, exact, chart_format, calibration)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(create_report, start_date, end_date, 1, use_cache, True, rollups, exact, chart_format,
+                                   calibration)
+                   for start_date, end_date in periods]
+        for future in futures:
+            future.result()
+
+def last_365_days():
+    # Brings the rolling window up to date; a report for exactly its period
+    # is computed from the window state instead of rescanning the year
+    return OEPS_Window.period(OEPS_Window.refresh())
+
+def year_range(start_year, end_year):
+    return datetime(start_year, 1, 1), datetime(end_year, 12, 31)
+
+def academic_year(start_year):
+    return datetime(start_year, ACADEMIC_YEAR_START_MONTH, 1), datetime(start_year + 1, ACADEMIC_YEAR_START_MONTH, 1) - timedelta(microseconds=1)
+
+def parse_period(text):
+    # "last365", "2018", "2014-2024" (calendar years) or "AY2018" (academic year)
+    try:
+        if text == 'last365':
+            return last_365_days()
+        if text.upper().startswith('AY'):
+            return academic_year(int(text[2:]))
+        start_year, _, end_year = text.partition('-')
+        return year_range(int(start_year), int(end_year or start_year))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid period: {text}. Use last365, YYYY, YYYY-YYYY or AYYYYY.")
+
 def get_report_period():
     while True:
         choice = input("Select reporting period:\n1. Last 365 days\n2. Custom year range\nEnter your choice (1 or 2): ")
         if choice == '1':
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=365)
-            return start_date, end_date
+            return last_365_days()
         elif choice == '2':
             while True:
                 try:
                     start_year = int(input("Enter start year: "))
                     end_year = int(input("Enter end year: "))
                     if start_year <= end_year:
-                        return datetime(start_year, 1, 1), datetime(end_year, 12, 31)
+                        return year_range(start_year, end_year)
                     else:
                         print("Start year must be less than or equal to end year.")
                 except ValueError:
@@ -370,9 +395,38 @@ def get_report_period():
         else:
             print("Invalid choice. Please enter 1 or 2.")
 
-def main():
-    start_date, end_date = get_report_period()
-    create_report(start_date, end_date)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate ITA assessment reports. Without periods, prompts for one interactively.")
+    parser.add_argument("--period", dest="periods", action="append", type=parse_period, default=[],
+                        help="Report period: last365, YYYY, YYYY-YYYY or AYYYYY (repeatable)")
+    parser.add_argument("--academic-years-since", type=int, metavar="YEAR",
+                        help="Add one report per academic year from YEAR to the current one")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for batch runs")
+    parser.add_argument("--no-cache", action="store_true", help="Re-render every chart")
+    parser.add_argument("--exact", action="store_true",
+                        help="Compute statistics from the raw exams instead of the quarterly rollups and sketches")
+    parser.add_argument("--chart-format", choices=["svg", "png"],
+                        help="Draw charts as vector graphics (svg, needs svglib; the default when installed) or images (png)")
+    parser.add_argument("--calibration", action="store_true",
+                        help="Add the examiner calibration page and write it to ITA_Calibration_<start>_to_<end>.json")
+    OEPS_Profiling.add_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    periods = list(args.periods)
+    if args.academic_years_since is not None:
+        current = datetime.now()
+        last_year = current.year if current.month >= ACADEMIC_YEAR_START_MONTH else current.year - 1
+        periods += [academic_year(year) for year in range(args.academic_years_since, last_year + 1)]
+
+    if periods:
+        OEPS_Profiling.run(args, create_reports, periods, args.workers, not args.no_cache, args.exact, args.chart_format,
+                           args.calibration)
+    else:
+        start_date, end_date = get_report_period()
+        OEPS_Profiling.run(args, create_report, start_date, end_date, use_cache=not args.no_cache, exact=args.exact,
+                           chart_format=args.chart_format, calibration=args.calibration)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+import OEPS_Calibration
+import OEPS_Items
+import OEPS_Notes
+import OEPS_Rollups
+import OEPS_Sketch
+
+QUESTION_COUNT = 3
+PASSING_BANDS = ['Low Pass', 'High Pass']
+# Up to this many exams, examiner box plots are computed from the raw scores
+# rather than from sketches
+EXACT_STATS_LIMIT = 10_000
+
+def build_frame(entries):
+    # Single pass over the raw entries (any iterable, consumed lazily): pull
+    # every field the report needs into columns so the statistics and charts
+    # never touch the entries again. Notes are reduced to word counts as they
+    # stream past rather than kept, and question texts to ids.
+    dates, examiners, totals, bands, eap_requirements = [], [], [], [], []
+    question_scores, prompt_codes = [], []
+    prompts, prompt_ids = [], {}
+    word_counter = OEPS_Notes.new_word_counter()
+    for entry in entries:
+        dates.append(entry['date'])
+        examiners.append(entry['examiner'])
+        totals.append(entry['total score'])
+        bands.append(entry['band'])
+        eap_requirements.append(entry['EAP requirement'])
+        scores = [np.nan] * QUESTION_COUNT
+        codes = [-1] * QUESTION_COUNT
+        for i, question in enumerate(entry['questions']):
+            scores[i] = question['question score']
+            codes[i] = prompt_ids.get(question['question'])
+            if codes[i] is None:
+                codes[i] = prompt_ids[question['question']] = len(prompts)
+                prompts.append(question['question'])
+            OEPS_Notes.add_notes(word_counter, question.get('notes', []))
+        question_scores.append(scores)
+        prompt_codes.append(codes)
+
+    question_scores = np.array(question_scores, dtype=float).reshape(-1, QUESTION_COUNT)
+    prompt_codes = np.array(prompt_codes, dtype=np.int64).reshape(-1, QUESTION_COUNT)
+    frame = pd.DataFrame({
+        'date': pd.to_datetime(pd.Series(dates, dtype=object), format='ISO8601'),
+        'examiner': examiners,
+        'score': np.array(totals, dtype=float),
+        'band': bands,
+        'eap': eap_requirements,
+    })
+    for i in range(QUESTION_COUNT):
+        frame[f'q{i+1}'] = question_scores[:, i]
+        # The prompt asked, as a categorical sharing one list of texts
+        frame[f'p{i+1}'] = pd.Categorical.from_codes(prompt_codes[:, i], prompts)
+    return frame, OEPS_Notes.word_frequencies(word_counter)
+
+def temporal_analysis(frame):
+    # Exams per calendar quarter, in chronological order
+    per_quarter = frame.groupby([frame['date'].dt.year, frame['date'].dt.quarter]).size()
+    sorted_quarters = [(f"{year} Q{quarter}", int(count)) for (year, quarter), count in per_quarter.items()]
+    return temporal_summary(sorted_quarters)
+
+def temporal_summary(sorted_quarters):
+    # Calculate overall trend
+    if len(sorted_quarters) > 1:
+        first_half = sum(count for _, count in sorted_quarters[:len(sorted_quarters)//2])
+        second_half = sum(count for _, count in sorted_quarters[len(sorted_quarters)//2:])
+        trend = "Increasing" if second_half > first_half else "Decreasing"
+    else:
+        trend = "Not enough data to determine trend"
+
+    # Find the busiest quarter (first one wins a tie)
+    busiest_quarter, busiest_quarter_count = max(sorted_quarters, key=lambda x: x[1])
+
+    return {
+        "quarters": sorted_quarters,
+        "trend": trend,
+        "busiest_quarter": busiest_quarter,
+        "busiest_quarter_count": busiest_quarter_count
+    }
+
+def summarize(frame, word_counts, exact=None):
+    # exact: examiner statistics from the raw scores (True) or from sketches
+    # (False); by default exact for up to EXACT_STATS_LIMIT exams
+    total_exams = len(frame)
+    scores = frame['score']
+    band_counts = frame['band'].value_counts(sort=False).to_dict()
+    if exact is None:
+        exact = total_exams <= EXACT_STATS_LIMIT
+    examiner_stats = {}
+    for examiner, group in frame.groupby('examiner', sort=False)['score']:
+        values = group.to_numpy()
+        if exact:
+            examiner_stats[examiner] = OEPS_Sketch.exact_box_stats(values)
+        else:
+            examiner_stats[examiner] = OEPS_Sketch.sketch_box_stats(OEPS_Sketch.from_values(values))
+
+    stats = {
+        "total_exams": total_exams,
+        "band_counts": band_counts,
+        "pass_rate": sum(band_counts.get(band, 0) for band in PASSING_BANDS) / total_exams,
+        "avg_score": float(scores.mean()),
+        "median_score": float(scores.median()),
+        "min_score": float(scores.min()),
+        "max_score": float(scores.max()),
+        "avg_question_scores": [float(np.nan_to_num(frame[f'q{i+1}'].mean())) for i in range(QUESTION_COUNT)],
+        "eap_counts": frame['eap'].value_counts(sort=False).to_dict(),
+        "examiner_stats": examiner_stats,
+        "exams_per_examiner": total_exams / len(examiner_stats),
+        "quarterly_avg": frame.set_index('date').resample('QE')['score'].mean(),
+        "word_counts": word_counts,
+        "items": OEPS_Items.analyze(OEPS_Items.item_sums(frame)),
+        # Per quarter and examiner score sketches, the input to OEPS_Calibration
+        "examiner_quarters": OEPS_Calibration.examiner_quarters_from_frame(frame),
+    }
+    stats.update(temporal_analysis(frame))
+    return stats
+
+def aggregate(entries, exact=None):
+    frame, word_counts = build_frame(entries)
+    if frame.empty:
+        return None
+    return summarize(frame, word_counts, exact)
+
+def summarize_rollups(quarters):
+    # Same statistics as summarize(), combined from quarterly rollups
+    labels = sorted(quarters, key=OEPS_Rollups.quarter_start)
+    rollup = OEPS_Rollups.merge_rollups(quarters[label] for label in labels)
+    total_exams = rollup['count']
+    band_counts = rollup['bands']
+    examiner_stats = {name: OEPS_Sketch.sketch_box_stats(sketch) for name, sketch in rollup['examiners'].items()}
+
+    # Quarter-end index with empty quarters left as gaps, as resample('QE') does
+    periods = pd.PeriodIndex([label.replace(' ', '') for label in labels], freq='Q')
+    quarterly_avg = pd.Series([quarters[label]['score_sum'] / quarters[label]['count'] for label in labels], index=periods)
+    quarterly_avg = quarterly_avg.reindex(pd.period_range(periods.min(), periods.max(), freq='Q'))
+    quarterly_avg.index = quarterly_avg.index.to_timestamp(how='end').normalize()
+
+    stats = {
+        "total_exams": total_exams,
+        "band_counts": band_counts,
+        "pass_rate": sum(band_counts.get(band, 0) for band in PASSING_BANDS) / total_exams,
+        "avg_score": rollup['score_sum'] / total_exams,
+        "median_score": OEPS_Sketch.sketch_quantile(rollup['scores'], 0.5),
+        "min_score": OEPS_Sketch.sketch_min(rollup['scores']),
+        "max_score": OEPS_Sketch.sketch_max(rollup['scores']),
+        "avg_question_scores": [total / count if count else 0 for total, count in zip(rollup['question_sums'], rollup['question_counts'])],
+        "eap_counts": rollup['eap'],
+        "examiner_stats": examiner_stats,
+        "exams_per_examiner": total_exams / len(examiner_stats),
+        "quarterly_avg": quarterly_avg,
+        "word_counts": rollup['words'],
+        "items": OEPS_Items.analyze(rollup['items']),
+        "examiner_quarters": OEPS_Calibration.examiner_quarters_from_rollups(quarters),
+    }
+    stats.update(temporal_summary([(label, quarters[label]['count']) for label in labels if quarters[label]['count']]))
+    return stats
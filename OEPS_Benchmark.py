@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import OEPS_Parquet
+import OEPS_Storage
+import OEPS_Synthetic
+
+# Times each reporting stage on synthetic data of increasing size and records
+# peak Python memory per stage, so results can be compared release to release.
+# tracemalloc slows Python code several-fold, so timings come from a clean run
+# and peak memory from a second, traced run in a fresh directory.
+
+DEFAULT_SIZES = [10_000, 100_000]
+SAVE_SAMPLES = 100
+# Historical exams bulk imported from a JSONL file
+IMPORT_SAMPLES = 20_000
+# Simultaneous examiner sessions and the exams each saves
+DEFAULT_WRITERS = 4
+SAVES_PER_WRITER = 50
+
+def measure(results, name, func, track_memory=True):
+    if track_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - started
+    peak_bytes = tracemalloc.get_traced_memory()[1] if track_memory else None
+    if track_memory:
+        tracemalloc.stop()
+    results[name] = {"seconds": seconds, "peak_bytes": peak_bytes}
+    return value
+
+def save_entries(seed, count, start_date):
+    # One examiner session, run in its own process
+    import OEPS_Examination
+    for entry in OEPS_Synthetic.generate_entries(count, start_date, start_date + timedelta(days=1), seed=seed):
+        OEPS_Examination.save_data(entry)
+    return count
+
+def concurrent_saves(writers, start_date):
+    with ProcessPoolExecutor(max_workers=writers) as executor:
+        futures = [executor.submit(save_entries, 1000 + writer, SAVES_PER_WRITER, start_date) for writer in range(writers)]
+        return sum(future.result() for future in futures)
+
+def count_everywhere():
+    # Exams in the store, the rollups, the search index and the Parquet
+    # mirror (if exported), which must agree
+    import OEPS_Index
+    import OEPS_Rollups
+    connection = OEPS_Index.open_or_rebuild()
+    try:
+        indexed = connection.execute("SELECT COUNT(*) FROM exams").fetchone()[0]
+    finally:
+        connection.close()
+    stored = sum(1 for _ in OEPS_Storage.iter_entries(fields=('date',)))
+    rolled_up = sum(rollup['count'] for rollup in OEPS_Rollups.load_or_rebuild().values())
+    if not OEPS_Parquet.is_current():
+        return stored, rolled_up, indexed
+    return stored, rolled_up, indexed, OEPS_Parquet.read_table(columns=["year"]).num_rows
+
+def run_size(size, track_memory=True, writers=DEFAULT_WRITERS):
+    import OEPS_AR
+    import OEPS_Aggregation
+    import OEPS_Calibration
+    import OEPS_Columnar
+    import OEPS_EXT_Reporting
+    import OEPS_Examination
+    import OEPS_Import
+    import OEPS_Index
+    import OEPS_Items
+    import OEPS_Rollups
+    import OEPS_Window
+
+    results = {}
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=3650)
+    measure(results, "generate", lambda: OEPS_Synthetic.write_jsonl(
+        OEPS_Storage.SNAPSHOT_FILE, OEPS_Synthetic.generate_entries(size, start_date, end_date)), False)
+
+    measure(results, "load", lambda: sum(1 for _ in OEPS_Storage.iter_entries()), track_memory)
+    measure(results, "filter", lambda: len(OEPS_Storage.query_range(end_date - timedelta(days=365), end_date)), track_memory)
+    stats = measure(results, "aggregate", lambda: OEPS_Aggregation.aggregate(OEPS_Storage.iter_range(start_date, end_date)), track_memory)
+    frame, _ = OEPS_Aggregation.build_frame(OEPS_Storage.iter_range(start_date, end_date))
+    measure(results, "item_analysis", lambda: OEPS_Items.analyze(OEPS_Items.item_sums(frame)), track_memory)
+    measure(results, "rollup_rebuild", OEPS_Rollups.rebuild, track_memory)
+    measure(results, "index_rebuild", OEPS_Index.rebuild, track_memory)
+    measure(results, "index_search", lambda: OEPS_Index.search(
+        note="too fast", question_number=3, start_date=end_date - timedelta(days=365), end_date=end_date), track_memory)
+    measure(results, "columnar_export", OEPS_Columnar.export, track_memory)
+    measure(results, "columnar_frame", lambda: OEPS_Aggregation.summarize(
+        *OEPS_Columnar.build_frame(OEPS_Columnar.open_columns(), start_date, end_date)), track_memory)
+    results["columnar_export"]["bytes"] = OEPS_Columnar.directory_size()
+    if OEPS_Parquet.available():
+        measure(results, "parquet_export", OEPS_Parquet.export, track_memory)
+        measure(results, "parquet_report_stats", lambda: OEPS_AR.compute_report_stats(
+            end_date - timedelta(days=365), end_date, exact=True), track_memory)
+    rollup_stats = measure(results, "rollup_report_stats", lambda: OEPS_AR.compute_report_stats(start_date, end_date), track_memory)
+    measure(results, "calibration", lambda: OEPS_Calibration.calibrate(rollup_stats['examiner_quarters']), track_memory)
+    visualizations = measure(results, "charts", lambda: OEPS_AR.generate_visualizations(stats, workers=1, use_cache=False), track_memory)
+    measure(results, "pdf", lambda: OEPS_AR.build_report_pdf(start_date, end_date, stats, visualizations), track_memory)
+    results["pdf"]["bytes"] = os.path.getsize(OEPS_AR.report_filename(start_date, end_date))
+    measure(results, "window_build", lambda: OEPS_Window.refresh(end_date), track_memory)
+    measure(results, "window_refresh", lambda: OEPS_Window.refresh(end_date + timedelta(days=1)), track_memory)
+    measure(results, "window_report_stats", lambda: OEPS_AR.compute_report_stats(
+        *OEPS_Window.period(OEPS_Window.load_window())), track_memory)
+    measure(results, "placement", lambda: OEPS_EXT_Reporting.create_pdf_report(
+        OEPS_EXT_Reporting.compile_student_list(OEPS_EXT_Reporting.load_latest_attempts())), track_memory)
+    measure(results, "placement_fast", lambda: OEPS_EXT_Reporting.create_fast_pdf_report(
+        OEPS_EXT_Reporting.group_students(OEPS_EXT_Reporting.load_latest_attempts())), track_memory)
+    measure(results, "placement_csv", lambda: OEPS_EXT_Reporting.write_csv(
+        OEPS_EXT_Reporting.group_students(OEPS_EXT_Reporting.load_latest_attempts())), track_memory)
+
+    new_entries = list(OEPS_Synthetic.generate_entries(SAVE_SAMPLES, end_date, end_date + timedelta(days=1), seed=1))
+    measure(results, "save", lambda: [OEPS_Examination.save_data(entry) for entry in new_entries], track_memory)
+    results["save"]["seconds_per_save"] = results["save"]["seconds"] / SAVE_SAMPLES
+
+    # Bulk import of older exams; every one must reach the store and the derived files
+    OEPS_Synthetic.write_jsonl("import.jsonl", OEPS_Synthetic.generate_entries(
+        IMPORT_SAMPLES, start_date - timedelta(days=3650), start_date, seed=2))
+    before = count_everywhere()
+    imported, _ = measure(results, "bulk_import", lambda: OEPS_Import.import_file("import.jsonl"), track_memory)
+    after = count_everywhere()
+    results["bulk_import"]["exams_per_second"] = imported / results["bulk_import"]["seconds"]
+    if any(count_after - count_before != imported for count_before, count_after in zip(before, after)):
+        raise RuntimeError(f"Lost imports: {imported} imported, counts went from {before} to {after}")
+
+    # Throughput with several sessions saving at once; every save must reach
+    # the store, the rollups and the index
+    name = f"concurrent_save_x{writers}"
+    before = count_everywhere()
+    saved = measure(results, name, lambda: concurrent_saves(writers, end_date + timedelta(days=2)), False)
+    after = count_everywhere()
+    results[name]["saves_per_second"] = saved / results[name]["seconds"]
+    if any(count_after - count_before != saved for count_before, count_after in zip(before, after)):
+        raise RuntimeError(f"Lost updates: {saved} saves, counts went from {before} to {after}")
+    return results
+
+def run_in_scratch_dir(size, track_memory, writers=DEFAULT_WRITERS):
+    # Each run gets its own scratch directory so the store, rollups, chart
+    # cache and PDFs never touch the real data
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="oeps_bench_") as work_dir:
+        os.chdir(work_dir)
+        try:
+            return run_size(size, track_memory, writers)
+        finally:
+            os.chdir(original_dir)
+
+def print_results(size, results, baseline=None):
+    print(f"\n{size:,} entries")
+    print(f"  {'stage':<22}{'seconds':>10}{'peak MB':>10}{'vs baseline':>14}")
+    for name, result in results.items():
+        peak = f"{result['peak_bytes'] / 1e6:.1f}" if result['peak_bytes'] is not None else "-"
+        change = ""
+        if baseline and name in baseline.get(str(size), {}):
+            previous = baseline[str(size)][name]["seconds"]
+            change = f"{result['seconds'] / previous:.2f}x" if previous else ""
+        print(f"  {name:<22}{result['seconds']:>10.3f}{peak:>10}{change:>14}")
+        if "saves_per_second" in result:
+            print(f"  {'':<22}{result['saves_per_second']:>10.1f} saves/s")
+        if "exams_per_second" in result:
+            print(f"  {'':<22}{result['exams_per_second']:>10.0f} exams/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OEPS report generation on synthetic data.")
+    parser.add_argument("sizes", type=int, nargs="*", default=DEFAULT_SIZES, help="Entry counts to benchmark")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced run (no peak memory)")
+    parser.add_argument("--writers", type=int, default=DEFAULT_WRITERS, help="Concurrent examiner sessions for the save throughput stage")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+
+    all_results = {}
+    for size in args.sizes:
+        results = run_in_scratch_dir(size, False, args.writers)
+        if not args.no_memory:
+            traced = run_in_scratch_dir(size, True, args.writers)
+            for name, result in results.items():
+                result["peak_bytes"] = traced[name]["peak_bytes"]
+        all_results[str(size)] = results
+        print_results(size, results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(all_results, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import OEPS_Rollups
+import OEPS_Sketch
+
+# Examiner calibration: how much harsher or more lenient each examiner scores
+# than the other examiners over the same period (severity), and how that
+# changes from one quarter to the next (drift), each with a bootstrap
+# confidence interval so an examiner with a handful of exams is not read as
+# reliably as one with hundreds.
+#
+# The input is one total score sketch per examiner and quarter (see
+# OEPS_Sketch), which both the quarterly rollups and the raw report columns
+# provide. The bootstrap is a Poisson bootstrap over the sketch bins: in each
+# resample every distinct score's count is redrawn as Poisson(count), which
+# resamples each examiner-quarter independently in one array operation
+# whatever its size. Resampled sums and counts then add up across
+# examiners and quarters like the sketches do, so the pool, the other
+# examiners and every period are resampled consistently from the same draws.
+
+CALIBRATION_VERSION = 1
+BOOTSTRAP_SAMPLES = 1000
+# Resamples drawn per array operation, bounding memory for large sketches
+BATCH_SIZE = 250
+CONFIDENCE = 0.95
+SEED = 2014
+# Examiners or quarters with fewer exams are reported but never flagged
+MIN_EXAMS = 30
+# Below this many Poisson draws in total, starting worker processes costs more than it saves
+PARALLEL_MIN_DRAWS = 5_000_000
+
+def calibration_filename(start_date, end_date):
+    return f"ITA_Calibration_{start_date.date()}_to_{end_date.date()}.json"
+
+def examiner_quarters_from_rollups(quarters):
+    # Quarter label -> examiner -> sketch, straight from the rollups
+    return {label: rollup["examiners"] for label, rollup in quarters.items() if rollup["count"]}
+
+def examiner_quarters_from_frame(frame):
+    # The same from report columns (see OEPS_Aggregation.build_frame)
+    labels = frame['date'].dt.year.astype(str) + ' Q' + frame['date'].dt.quarter.astype(str)
+    examiner_quarters = {}
+    for (label, examiner), group in frame.groupby([labels, 'examiner'], sort=False)['score']:
+        examiner_quarters.setdefault(label, {})[examiner] = OEPS_Sketch.from_values(group.to_numpy())
+    return examiner_quarters
+
+def resample(sketch, rng, samples=BOOTSTRAP_SAMPLES):
+    # Poisson bootstrap of one sketch: (resampled sums, resampled counts)
+    values, counts = OEPS_Sketch.distribution(sketch)
+    sums = np.empty(samples)
+    sizes = np.empty(samples)
+    for start in range(0, samples, BATCH_SIZE):
+        stop = min(start + BATCH_SIZE, samples)
+        draws = rng.poisson(counts, size=(stop - start, counts.size))
+        sums[start:stop] = draws @ values
+        sizes[start:stop] = draws.sum(axis=1)
+    return sums, sizes
+
+def examiner_rng(examiner, seed=SEED):
+    # Seeded by name, so an examiner's draws do not depend on who else is in
+    # the period or on which worker process draws them
+    return np.random.default_rng([seed, zlib.crc32(examiner.encode('utf-8'))])
+
+def resample_examiner(examiner, sketches, samples=BOOTSTRAP_SAMPLES, seed=SEED):
+    # sketches: quarter label -> sketch for one examiner
+    rng = examiner_rng(examiner, seed)
+    return {label: resample(sketches[label], rng, samples) for label in sorted(sketches, key=OEPS_Rollups.quarter_start)}
+
+def _resample_all(by_examiner, samples, seed, workers):
+    examiners = list(by_examiner)
+    draws = sum(len(sketch["bins"]) for sketches in by_examiner.values() for sketch in sketches.values()) * samples
+    if workers == 1 or len(examiners) <= 1 or draws < PARALLEL_MIN_DRAWS:
+        return {examiner: resample_examiner(examiner, by_examiner[examiner], samples, seed) for examiner in examiners}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(resample_examiner, examiners, [by_examiner[examiner] for examiner in examiners],
+                               [samples] * len(examiners), [seed] * len(examiners))
+        return dict(zip(examiners, results))
+
+def _interval(draws, confidence):
+    # Percentile interval; resamples that left a group empty are skipped
+    draws = draws[~np.isnan(draws)]
+    if not draws.size:
+        return None
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(draws, [tail, 100 - tail])
+    return [float(low), float(high)]
+
+def _severity(own_sum, own_count, pool_sum, pool_count):
+    # Mean of the other examiners' exams minus the examiner's own mean, so a
+    # positive severity means harsher than the others. Works on resampled
+    # arrays too; where a group is empty the result is nan.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        others = np.divide(pool_sum - own_sum, pool_count - own_count)
+        return others - np.divide(own_sum, own_count)
+
+def _excludes_zero(interval):
+    return interval is not None and (interval[0] > 0 or interval[1] < 0)
+
+def calibrate(examiner_quarters, samples=BOOTSTRAP_SAMPLES, workers=None, confidence=CONFIDENCE, seed=SEED):
+    # examiner_quarters: quarter label -> examiner -> sketch. Returns the pool
+    # mean and, per examiner (harshest first), the severity over the period
+    # and per quarter with the drift since the examiner's previous quarter.
+    # Severity and drift are flagged when their interval excludes zero and
+    # enough exams are behind them.
+    labels = sorted(examiner_quarters, key=OEPS_Rollups.quarter_start)
+    by_examiner = {}
+    for label in labels:
+        for examiner, sketch in examiner_quarters[label].items():
+            if sketch["count"]:
+                by_examiner.setdefault(examiner, {})[label] = sketch
+    resampled = _resample_all(by_examiner, samples, seed, workers)
+
+    # Pool totals per quarter, exact and resampled
+    quarter_sum = {label: sum(sketch["sum"] for sketch in examiner_quarters[label].values()) for label in labels}
+    quarter_count = {label: sum(sketch["count"] for sketch in examiner_quarters[label].values()) for label in labels}
+    quarter_sums = {label: np.zeros(samples) for label in labels}
+    quarter_sizes = {label: np.zeros(samples) for label in labels}
+    for draws in resampled.values():
+        for label, (sums, sizes) in draws.items():
+            quarter_sums[label] += sums
+            quarter_sizes[label] += sizes
+    pool_sum, pool_count = sum(quarter_sum.values()), sum(quarter_count.values())
+    pool_sums, pool_sizes = sum(quarter_sums.values()), sum(quarter_sizes.values())
+
+    examiners = []
+    for examiner, sketches in by_examiner.items():
+        own_sum = sum(sketch["sum"] for sketch in sketches.values())
+        own_count = sum(sketch["count"] for sketch in sketches.values())
+        own_sums = sum(sums for sums, _ in resampled[examiner].values())
+        own_sizes = sum(sizes for _, sizes in resampled[examiner].values())
+        severity = _severity(own_sum, own_count, pool_sum, pool_count)
+        interval = _interval(_severity(own_sums, own_sizes, pool_sums, pool_sizes), confidence)
+
+        quarters = []
+        previous = None
+        for label, sketch in sketches.items():
+            sums, sizes = resampled[examiner][label]
+            quarter_severity = _severity(sketch["sum"], sketch["count"], quarter_sum[label], quarter_count[label])
+            quarter_draws = _severity(sums, sizes, quarter_sums[label], quarter_sizes[label])
+            quarter = {
+                "quarter": label,
+                "count": sketch["count"],
+                "mean": sketch["sum"] / sketch["count"],
+                "severity": None if np.isnan(quarter_severity) else float(quarter_severity),
+                "severity_ci": _interval(quarter_draws, confidence),
+                "drift": None,
+                "drift_ci": None,
+                "drift_flagged": False,
+            }
+            # Drift from the examiner's previous quarter with other examiners to compare against
+            if quarter["severity"] is not None:
+                if previous is not None:
+                    previous_quarter, previous_draws = previous
+                    quarter["drift"] = quarter["severity"] - previous_quarter["severity"]
+                    quarter["drift_ci"] = _interval(quarter_draws - previous_draws, confidence)
+                    quarter["drift_flagged"] = (_excludes_zero(quarter["drift_ci"]) and
+                                                min(sketch["count"], previous_quarter["count"]) >= MIN_EXAMS)
+                previous = quarter, quarter_draws
+            quarters.append(quarter)
+
+        examiners.append({
+            "examiner": examiner,
+            "count": own_count,
+            "mean": own_sum / own_count,
+            "severity": None if np.isnan(severity) else float(severity),
+            "severity_ci": interval,
+            "flagged": _excludes_zero(interval) and own_count >= MIN_EXAMS,
+            "quarters": quarters,
+        })
+    examiners.sort(key=lambda row: (row["severity"] is None, -(row["severity"] or 0), row["examiner"]))
+
+    return {
+        "version": CALIBRATION_VERSION,
+        "samples": samples,
+        "confidence": confidence,
+        "seed": seed,
+        "min_exams": MIN_EXAMS,
+        "pool": {"count": pool_count, "mean": pool_sum / pool_count if pool_count else None},
+        "examiners": examiners,
+    }
+
+def latest_drift(row):
+    # The examiner's most recent quarter with a drift, or None
+    return next((quarter for quarter in reversed(row["quarters"]) if quarter["drift"] is not None), None)
+
+def write_calibration(path, calibration, start_date, end_date):
+    tmp_file = path + ".tmp"
+    with open(tmp_file, 'w') as file:
+        json.dump(dict(calibration, start=start_date.isoformat(), end=end_date.isoformat()), file, indent=2)
+    os.replace(tmp_file, path)
+
+def main():
+    import OEPS_AR
+    parser = argparse.ArgumentParser(description="Examiner calibration: severity and quarter-over-quarter drift with bootstrap intervals.")
+    parser.add_argument("period", type=OEPS_AR.parse_period, help="last365, YYYY, YYYY-YYYY or AYYYYY")
+    parser.add_argument("--samples", type=int, default=BOOTSTRAP_SAMPLES, help="Bootstrap resamples")
+    parser.add_argument("--workers", type=int, help="Worker processes for the bootstrap")
+    parser.add_argument("--exact", action="store_true", help="Read the raw exams instead of the quarterly rollups")
+    args = parser.parse_args()
+
+    start_date, end_date = args.period
+    stats = OEPS_AR.compute_report_stats(start_date, end_date, exact=args.exact)
+    if stats is None:
+        print(f"No data available for the selected period ({start_date.date()} to {end_date.date()}).")
+        return
+    calibration = calibrate(stats["examiner_quarters"], args.samples, args.workers)
+    path = calibration_filename(start_date, end_date)
+    write_calibration(path, calibration, start_date, end_date)
+
+    print(f"{'Examiner':<24}{'Exams':>8}{'Mean':>8}{'Severity':>10}  {f'{CONFIDENCE:.0%} interval':<18}{'Latest drift':>13}")
+    for row in calibration["examiners"]:
+        interval = "-" if row["severity_ci"] is None else f"{row['severity_ci'][0]:+.2f} to {row['severity_ci'][1]:+.2f}"
+        severity = "-" if row["severity"] is None else f"{row['severity']:+.2f}"
+        drift = latest_drift(row)
+        drift = "-" if drift is None else f"{drift['drift']:+.2f}" + (" *" if drift["drift_flagged"] else "")
+        print(f"{row['examiner'][:23]:<24}{row['count']:>8}{row['mean']:>8.2f}{severity:>10}"
+              f"{'*' if row['flagged'] else ' '} {interval:<18}{drift:>13}")
+    print(f"* interval excludes zero. Written to {path}.")
+
+if __name__ == "__main__":
+    main()
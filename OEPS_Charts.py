@@ -0,0 +1,252 @@
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from wordcloud import WordCloud
+import OEPS_Profiling
+
+# Rendered charts are cached on disk keyed by a hash of the chart kind and its
+# input data; bump CHART_VERSION whenever a renderer's output changes
+CACHE_DIR = ".oeps_chart_cache"
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CHART_VERSION = 2
+
+# Charts are saved as SVG and drawn into the report PDF as vector graphics
+# (through svglib) when svglib is installed, otherwise as PNG images
+CHART_FORMATS = ['svg', 'png']
+
+# Every chart is drawn on its own Figure rather than through the pyplot
+# state machine, so charts can be rendered side by side in worker
+# processes. Each renderer takes plain data and returns the Figure.
+
+def default_format():
+    try:
+        import svglib
+    except ImportError:
+        return 'png'
+    return 'svg'
+
+def _to_bytes(fig, chart_format):
+    if chart_format == 'png':
+        FigureCanvasAgg(fig)
+    img_buffer = io.BytesIO()
+    # SVG text stays text (set in the PDF's own fonts) rather than one path
+    # per glyph, which keeps the charts small and quick to convert
+    with matplotlib.rc_context({'svg.fonttype': 'none'}):
+        fig.savefig(img_buffer, format=chart_format)
+    return img_buffer.getvalue()
+
+def chart_flowable(image, width, height):
+    # A reportlab flowable showing the chart bytes in a width x height box
+    if image.startswith(b'<'):
+        from svglib.svglib import svg2rlg
+        drawing = svg2rlg(io.BytesIO(image))
+        drawing.scale(width / drawing.width, height / drawing.height)
+        drawing.width, drawing.height = width, height
+        return drawing
+    from reportlab.platypus import Image
+    return Image(io.BytesIO(image), width=width, height=height)
+
+def _label_bars(ax, bars):
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height,
+                f'{height:.2f}',
+                ha='center', va='bottom')
+
+def pie_chart(title, labels, values):
+    fig = Figure(figsize=(8, 6))
+    ax = fig.add_subplot()
+    ax.pie(values, labels=labels, autopct='%1.1f%%')
+    ax.set_title(title)
+    return fig
+
+def score_trend(dates, values):
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    ax.plot(dates, values, marker='o')
+    ax.set_title('Average Scores by Quarter')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Average Total Score')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+
+    # Add value labels on the points
+    for x, y in zip(dates, values):
+        ax.annotate(f'{y:.2f}', (x, y), textcoords="offset points", xytext=(0,10), ha='center')
+
+    return fig
+
+def question_averages(avg_scores):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    bars = ax.bar(['Question 1', 'Question 2', 'Question 3'], avg_scores)
+    ax.set_title('Average Scores by Question Type')
+    ax.set_ylabel('Average Score')
+    ax.set_ylim(0, 3)  # Set y-axis limit from 0 to 3
+    _label_bars(ax, bars)
+    fig.tight_layout()
+    return fig
+
+def word_cloud(frequencies):
+    with OEPS_Profiling.stage("WordCloud.generate_from_frequencies"):
+        wordcloud = WordCloud(width=800, height=400, background_color='white').generate_from_frequencies(frequencies)
+    fig = Figure(figsize=(10, 5))
+    ax = fig.add_subplot()
+    ax.imshow(wordcloud, interpolation='bilinear')
+    ax.axis('off')
+    ax.set_title('Word Cloud of Examiner Notes (Stop Words Removed)')
+    return fig
+
+def common_words(words, counts):
+    fig = Figure(figsize=(10, 5))
+    ax = fig.add_subplot()
+    ax.bar(words, counts)
+    ax.set_title('Top 10 Most Common Words in Examiner Notes (Stop Words Removed)')
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    fig.tight_layout()
+    return fig
+
+def examiner_boxplot(examiners, stats):
+    # Drawn from precomputed statistics (see OEPS_Sketch.box_stats), so
+    # the raw scores never reach the renderer
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    ax.bxp([dict(box, label=examiner) for examiner, box in zip(examiners, stats)])
+    ax.set_title('Score Distribution by Examiner')
+    ax.set_xlabel('Examiner')
+    ax.set_ylabel('Total Score')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return fig
+
+def examiner_severity(examiners, severity, lows, highs, flagged):
+    # One row per examiner: severity against the other examiners with its
+    # bootstrap interval; examiners whose interval excludes zero in red
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    rows = list(range(len(examiners)))
+    for row, value, low, high, flag in zip(rows, severity, lows, highs, flagged):
+        color = 'tab:red' if flag else 'tab:blue'
+        ax.errorbar([value], [row], xerr=[[value - low], [high - value]], fmt='o', color=color, capsize=4)
+    ax.axvline(0, color='grey', linestyle='--', linewidth=1)
+    ax.set_yticks(rows)
+    ax.set_yticklabels(examiners)
+    ax.invert_yaxis()
+    ax.set_title('Examiner Severity (other examiners\' mean minus own mean)')
+    ax.set_xlabel('Severity (points; positive = harsher)')
+    fig.tight_layout()
+    return fig
+
+def quarterly_counts(quarters, counts):
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    ax.bar(quarters, counts)
+    ax.set_title('Number of Exams per Quarter')
+    ax.set_xlabel('Quarter')
+    ax.set_ylabel('Number of Exams')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return fig
+
+CHARTS = {
+    'pie_chart': pie_chart,
+    'score_trend': score_trend,
+    'question_averages': question_averages,
+    'word_cloud': word_cloud,
+    'common_words': common_words,
+    'examiner_boxplot': examiner_boxplot,
+    'quarterly_counts': quarterly_counts,
+    'examiner_severity': examiner_severity,
+}
+
+def render_chart(job, chart_format='png'):
+    kind, data = job
+    with OEPS_Profiling.stage(f"chart {kind}", title=data.get('title')):
+        return _to_bytes(CHARTS[kind](**data), chart_format)
+
+def _render_chart_traced(job, chart_format):
+    # Runs in a worker process: trace locally and hand the events back
+    OEPS_Profiling.start_trace()
+    image = render_chart(job, chart_format)
+    return image, OEPS_Profiling.stop_trace()
+
+def chart_key(job, chart_format='png'):
+    kind, data = job
+    payload = json.dumps([CHART_VERSION, chart_format, kind, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _cache_path(key, chart_format):
+    return os.path.join(CACHE_DIR, f"{key}.{chart_format}")
+
+def read_cached_chart(key, chart_format='png'):
+    path = _cache_path(key, chart_format)
+    try:
+        with open(path, 'rb') as file:
+            image = file.read()
+    except FileNotFoundError:
+        return None
+    # Touch on every hit so eviction drops the least recently used charts
+    os.utime(path)
+    return image
+
+def write_cached_chart(key, image, chart_format='png'):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_file = f"{_cache_path(key, chart_format)}.{os.getpid()}.tmp"
+    with open(tmp_file, 'wb') as file:
+        file.write(image)
+    os.replace(tmp_file, _cache_path(key, chart_format))
+
+def evict_cached_charts(max_bytes=CACHE_MAX_BYTES):
+    try:
+        files = [entry for entry in os.scandir(CACHE_DIR) if entry.name.endswith(tuple(f'.{chart_format}' for chart_format in CHART_FORMATS))]
+    except FileNotFoundError:
+        return
+    files = sorted(((entry.stat(), entry.path) for entry in files), key=lambda x: x[0].st_mtime)
+    total_bytes = sum(stat.st_size for stat, _ in files)
+    for stat, path in files:
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= stat.st_size
+
+def _render_all(jobs, workers, chart_format):
+    if workers == 1 or len(jobs) <= 1:
+        return [render_chart(job, chart_format) for job in jobs]
+    formats = [chart_format] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if not OEPS_Profiling.tracing():
+            return list(executor.map(render_chart, jobs, formats))
+        images = []
+        for image, events in executor.map(_render_chart_traced, jobs, formats):
+            OEPS_Profiling.add_events(events)
+            images.append(image)
+        return images
+
+def render_charts(jobs, workers=None, use_cache=True, chart_format='png'):
+    # jobs is a list of (chart kind, keyword arguments); results keep job order.
+    # Cached charts are served from disk and the rest are rendered concurrently,
+    # so wall time is roughly that of the slowest uncached chart.
+    if not use_cache:
+        return _render_all(jobs, workers, chart_format)
+
+    with OEPS_Profiling.stage("chart cache lookup"):
+        keys = [chart_key(job, chart_format) for job in jobs]
+        images = [read_cached_chart(key, chart_format) for key in keys]
+    missing = [i for i, image in enumerate(images) if image is None]
+    if missing:
+        rendered = _render_all([jobs[i] for i in missing], workers, chart_format)
+        for i, image in zip(missing, rendered):
+            images[i] = image
+            write_cached_chart(keys[i], image, chart_format)
+        evict_cached_charts()
+    return images
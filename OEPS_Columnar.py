@@ -0,0 +1,355 @@
+import argparse
+import json
+import os
+import shutil
+from array import array
+from datetime import datetime, timedelta
+import numpy as np
+import OEPS_Storage
+
+# Compact column store for exam records: one .npy file per column, loadable
+# with numpy's memory mapping so a reader touches only the pages it needs,
+# plus meta.json holding the dictionaries. Names, question texts, note phrases,
+# bands and EAP requirements are stored once and referred to by integer id;
+# scores and timestamps are fixed-width integers. Rows keep the store's date
+# order, so a date range is a binary search over the dates column.
+#
+# Every entry round-trips exactly. An entry the columns cannot reproduce
+# (an unexpected field, a score off the 0.01 grid, a date not written by
+# isoformat()) is kept whole in meta.json and returned as is.
+#
+# The column store is a benchmark-only artifact: reports and the service
+# never read it (they use the rollups and, for --exact reports, the store or
+# its Parquet mirror); only OEPS_Benchmark measures it. It is a snapshot:
+# saves do not update it. meta.json records the store files' signature at
+# export (see OEPS_Storage.store_signature), and once any exam is saved or
+# the journal compacted the columns are no longer current and are not read
+# until exported again.
+
+COLUMN_DIR = "OEPS_columns"
+COLUMN_VERSION = 2
+QUESTION_COUNT = 3
+EPOCH = datetime(1970, 1, 1)
+ENTRY_FIELDS = ["examiner", "student", "date", "questions", "total score", "band", "EAP requirement"]
+QUESTION_FIELDS = ["question", "notes", "question score"]
+
+# name -> numpy dtype of each column file (widened when the ids do not fit,
+# see _fit). Question columns have
+# QUESTION_COUNT values per row; -1 marks a missing question. Notes are
+# flattened: the notes of row r, question q are
+# note_ids[note_offsets[r * QUESTION_COUNT + q]:note_offsets[r * QUESTION_COUNT + q + 1]]
+COLUMNS = {
+    "date": np.int64,            # microseconds since 1970-01-01
+    "examiner": np.int32,
+    "student": np.int32,
+    "total_score": np.int16,     # hundredths
+    "band": np.int8,
+    "eap": np.int8,
+    "question": np.int16,
+    "question_score": np.int8,
+    "note_offsets": np.int64,
+    "note_ids": np.int32,
+}
+
+# Column -> dictionary it indexes
+DICTIONARIES = {
+    "examiner": "examiners",
+    "student": "students",
+    "band": "bands",
+    "eap": "eap_requirements",
+    "question": "questions",
+    "note_ids": "notes",
+}
+
+def _to_micros(date):
+    return (date - EPOCH) // timedelta(microseconds=1)
+
+def _text_id(dictionary, lookup, text):
+    text_id = lookup.get(text)
+    if text_id is None:
+        text_id = lookup[text] = len(dictionary)
+        dictionary.append(text)
+    return text_id
+
+def _encode(entry, dictionaries, lookups):
+    # Column values for one entry, or None if the columns cannot hold it exactly
+    if list(entry) != ENTRY_FIELDS or len(entry['questions']) > QUESTION_COUNT:
+        return None
+    date = OEPS_Storage.entry_date(entry)
+    score = entry['total score']
+    if (date.isoformat() != entry['date'] or not isinstance(score, float)
+            or round(score * 100) / 100 != score or not 0 <= score <= 300):
+        return None
+    questions, question_scores, notes = [], [], []
+    for question in entry['questions']:
+        if (list(question) != QUESTION_FIELDS or type(question['question score']) is not int
+                or not -128 < question['question score'] < 128):
+            return None
+        questions.append(_text_id(dictionaries["questions"], lookups["questions"], question['question']))
+        question_scores.append(question['question score'])
+        notes.append([_text_id(dictionaries["notes"], lookups["notes"], note) for note in question['notes']])
+    missing = QUESTION_COUNT - len(questions)
+    return {
+        "date": _to_micros(date),
+        "examiner": _text_id(dictionaries["examiners"], lookups["examiners"], entry['examiner']),
+        "student": _text_id(dictionaries["students"], lookups["students"], entry['student']),
+        "total_score": round(score * 100),
+        "band": _text_id(dictionaries["bands"], lookups["bands"], entry['band']),
+        "eap": _text_id(dictionaries["eap_requirements"], lookups["eap_requirements"], entry['EAP requirement']),
+        "question": questions + [-1] * missing,
+        "question_score": question_scores + [-1] * missing,
+        "notes": notes + [[]] * missing,
+    }
+
+def _fit(values, dtype):
+    # The values as dtype, or as the narrowest wider type that holds them
+    # (e.g. more distinct question texts than int16 ids reach); np.load
+    # reads whatever type the file was written with
+    for candidate in (dtype, np.int16, np.int32, np.int64):
+        if np.dtype(candidate).itemsize < np.dtype(dtype).itemsize:
+            continue
+        info = np.iinfo(candidate)
+        if not values.size or (info.min <= values.min() and values.max() <= info.max):
+            return values.astype(candidate)
+
+def _signature():
+    # OEPS_Storage.store_signature as stored in meta.json
+    return [list(part) if part else None for part in OEPS_Storage.store_signature()]
+
+def write_columns(entries, directory=COLUMN_DIR, store=None):
+    # Entries must be in date order (as the store yields them). store: the
+    # signature of the store they were read from
+    dictionaries = {name: [] for name in DICTIONARIES.values()}
+    lookups = {name: {} for name in DICTIONARIES.values()}
+    values = {name: array('q') for name in COLUMNS}
+    values["note_offsets"].append(0)
+    overrides = {}
+    count = 0
+    for entry in entries:
+        row = _encode(entry, dictionaries, lookups)
+        if row is None:
+            # Kept whole; the row itself only carries the date for range lookups
+            overrides[str(count)] = entry
+            row = {"date": _to_micros(OEPS_Storage.entry_date(entry)), "examiner": -1, "student": -1,
+                   "total_score": -1, "band": -1, "eap": -1, "question": [-1] * QUESTION_COUNT,
+                   "question_score": [-1] * QUESTION_COUNT, "notes": [[]] * QUESTION_COUNT}
+        for name in ("date", "examiner", "student", "total_score", "band", "eap"):
+            values[name].append(row[name])
+        values["question"].extend(row["question"])
+        values["question_score"].extend(row["question_score"])
+        for note_ids in row["notes"]:
+            values["note_ids"].extend(note_ids)
+            values["note_offsets"].append(len(values["note_ids"]))
+        count += 1
+
+    # Written to a temporary directory and swapped in whole
+    tmp_dir = directory + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, dtype in COLUMNS.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), _fit(np.frombuffer(values[name], dtype=np.int64), dtype))
+    with open(os.path.join(tmp_dir, "meta.json"), 'w') as file:
+        json.dump({"version": COLUMN_VERSION, "count": count, "dictionaries": dictionaries,
+                   "overrides": overrides, "store": store}, file)
+    old_dir = directory + ".old"
+    if os.path.exists(directory):
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return count
+
+def export(directory=COLUMN_DIR):
+    # Snapshot the whole store into the column format
+    with OEPS_Storage.locked():
+        OEPS_Storage.migrate()
+        return write_columns(OEPS_Storage.iter_sorted(), directory, _signature())
+
+def load_meta(directory=COLUMN_DIR):
+    # meta.json of a column store written by this version, or None
+    try:
+        with open(os.path.join(directory, "meta.json"), 'r') as file:
+            meta = json.load(file)
+    except FileNotFoundError:
+        return None
+    if meta.get("version") != COLUMN_VERSION:
+        return None
+    return meta
+
+def is_current(directory=COLUMN_DIR, meta=None):
+    # Whether the columns hold exactly what the store holds now
+    meta = meta or load_meta(directory)
+    return meta is not None and meta["store"] == _signature()
+
+def open_columns(directory=COLUMN_DIR):
+    # Columns memory-mapped (nothing is read until used), or None if there
+    # is no current column store
+    meta = load_meta(directory)
+    if not is_current(directory, meta):
+        return None
+    columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in COLUMNS}
+    columns["meta"] = meta
+    columns["overrides"] = {int(row): entry for row, entry in meta["overrides"].items()}
+    return columns
+
+def row_range(columns, start_date=None, end_date=None):
+    # Rows with start_date <= date <= end_date
+    dates = columns["date"]
+    start = 0 if start_date is None else int(np.searchsorted(dates, _to_micros(start_date), side='left'))
+    end = len(dates) if end_date is None else int(np.searchsorted(dates, _to_micros(end_date), side='right'))
+    return start, end
+
+# Rows decoded per batch when iterating entries
+DECODE_CHUNK_ROWS = 10_000
+
+def _iso_dates(micros):
+    # Same text as datetime.isoformat(), which leaves out zero microseconds
+    dates = np.datetime_as_string(np.asarray(micros).astype('datetime64[us]'), unit='us').tolist()
+    return [date[:-7] if date.endswith(".000000") else date for date in dates]
+
+def _decode_rows(columns, start, end):
+    # Columns are sliced into plain lists once per batch; indexing memory
+    # mapped arrays one value at a time is far slower
+    dictionaries = columns["meta"]["dictionaries"]
+    overrides = columns["overrides"]
+    question_texts, notes = dictionaries["questions"], dictionaries["notes"]
+    for chunk_start in range(start, end, DECODE_CHUNK_ROWS):
+        chunk_end = min(chunk_start + DECODE_CHUNK_ROWS, end)
+        dates = _iso_dates(columns["date"][chunk_start:chunk_end])
+        examiners = columns["examiner"][chunk_start:chunk_end].tolist()
+        students = columns["student"][chunk_start:chunk_end].tolist()
+        total_scores = columns["total_score"][chunk_start:chunk_end].tolist()
+        bands = columns["band"][chunk_start:chunk_end].tolist()
+        eaps = columns["eap"][chunk_start:chunk_end].tolist()
+        questions = columns["question"][chunk_start * QUESTION_COUNT:chunk_end * QUESTION_COUNT].tolist()
+        question_scores = columns["question_score"][chunk_start * QUESTION_COUNT:chunk_end * QUESTION_COUNT].tolist()
+        offsets = columns["note_offsets"][chunk_start * QUESTION_COUNT:chunk_end * QUESTION_COUNT + 1].tolist()
+        note_ids = columns["note_ids"][offsets[0]:offsets[-1]].tolist()
+        for i in range(chunk_end - chunk_start):
+            override = overrides.get(chunk_start + i)
+            if override is not None:
+                yield override
+                continue
+            entry_questions = []
+            for slot in range(i * QUESTION_COUNT, (i + 1) * QUESTION_COUNT):
+                if questions[slot] < 0:
+                    break
+                entry_questions.append({
+                    "question": question_texts[questions[slot]],
+                    "notes": [notes[note_id] for note_id in note_ids[offsets[slot] - offsets[0]:offsets[slot + 1] - offsets[0]]],
+                    "question score": question_scores[slot],
+                })
+            yield {
+                "examiner": dictionaries["examiners"][examiners[i]],
+                "student": dictionaries["students"][students[i]],
+                "date": dates[i],
+                "questions": entry_questions,
+                "total score": total_scores[i] / 100,
+                "band": dictionaries["bands"][bands[i]],
+                "EAP requirement": dictionaries["eap_requirements"][eaps[i]],
+            }
+
+def iter_entries(columns, start_date=None, end_date=None):
+    start, end = row_range(columns, start_date, end_date)
+    return _decode_rows(columns, start, end)
+
+def build_frame(columns, start_date=None, end_date=None):
+    # The same (frame, word counts) as OEPS_Aggregation.build_frame, built
+    # with array operations on the columns instead of per-entry parsing
+    import pandas as pd
+    import OEPS_Notes
+    start, end = row_range(columns, start_date, end_date)
+    dictionaries = columns["meta"]["dictionaries"]
+
+    def lookup(name, dictionary):
+        # Placeholder rows of kept-whole entries have id -1; they are dropped below
+        return np.array(dictionaries[dictionary] + [None], dtype=object)[np.asarray(columns[name][start:end])]
+
+    question_scores = np.asarray(columns["question_score"][start * QUESTION_COUNT:end * QUESTION_COUNT], dtype=float)
+    question_scores = question_scores.reshape(-1, QUESTION_COUNT)
+    question_scores[question_scores < 0] = np.nan
+    frame = pd.DataFrame({
+        'date': pd.to_datetime(np.asarray(columns["date"][start:end]), unit='us'),
+        'examiner': lookup("examiner", "examiners"),
+        'score': np.asarray(columns["total_score"][start:end]) / 100,
+        'band': lookup("band", "bands"),
+        'eap': lookup("eap", "eap_requirements"),
+    })
+    question_ids = np.asarray(columns["question"][start * QUESTION_COUNT:end * QUESTION_COUNT]).reshape(-1, QUESTION_COUNT)
+    for i in range(QUESTION_COUNT):
+        frame[f'q{i+1}'] = question_scores[:, i]
+        frame[f'p{i+1}'] = pd.Categorical.from_codes(question_ids[:, i], dictionaries["questions"])
+
+    # Count each note phrase once, then weight its words by how often it occurs
+    offsets = columns["note_offsets"]
+    note_ids = np.asarray(columns["note_ids"][offsets[start * QUESTION_COUNT]:offsets[end * QUESTION_COUNT]])
+    occurrences = np.bincount(note_ids, minlength=len(dictionaries["notes"])) if note_ids.size else []
+    word_counter = OEPS_Notes.new_word_counter()
+    for note_id in np.flatnonzero(occurrences):
+        word_counter["pending"][dictionaries["notes"][note_id]] += int(occurrences[note_id])
+
+    # Entries kept whole go through the regular per-entry path
+    override_rows = sorted(row for row in columns["overrides"] if start <= row < end)
+    if override_rows:
+        import OEPS_Aggregation
+        extra_frame, _ = OEPS_Aggregation.build_frame(columns["overrides"][row] for row in override_rows)
+        OEPS_Notes.add_notes(word_counter, [note for row in override_rows
+                                            for question in columns["overrides"][row]['questions']
+                                            for note in question.get('notes', [])])
+        frame = frame.drop(index=[row - start for row in override_rows])
+        frame = pd.concat([frame, extra_frame]).sort_values('date', kind='stable').reset_index(drop=True)
+    return frame, OEPS_Notes.word_frequencies(word_counter)
+
+def write_json(columns, path):
+    # Export back to the legacy OEPS_data.json layout
+    count = 0
+    with open(path, 'w') as file:
+        file.write("[")
+        for entry in iter_entries(columns):
+            file.write(("," if count else "") + "\n" + json.dumps(entry, indent=2))
+            count += 1
+        file.write("\n]")
+    return count
+
+def directory_size(directory=COLUMN_DIR):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+def verify(columns):
+    # Compare every decoded entry with the store; returns the number of mismatches
+    count = columns["meta"]["count"]
+    decoded = _decode_rows(columns, 0, count)
+    mismatches = seen = 0
+    for entry in OEPS_Storage.iter_sorted():
+        seen += 1
+        if seen > count or next(decoded) != entry:
+            mismatches += 1
+    return mismatches + max(count - seen, 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert OEPS exam data to and from the compact column format.")
+    parser.add_argument("command", choices=["export", "to-json", "verify"],
+                        help="export: store -> columns; to-json: columns -> JSON array; verify: compare with the store")
+    parser.add_argument("--dir", default=COLUMN_DIR, help="Column store directory")
+    parser.add_argument("--output", default="OEPS_export.json", help="JSON file written by to-json")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        count = export(args.dir)
+        print(f"Wrote {count} entries to {args.dir}/ ({directory_size(args.dir) / 1e6:.1f} MB).")
+        return
+    columns = open_columns(args.dir)
+    if columns is None:
+        if load_meta(args.dir) is None:
+            print(f"No column store in {args.dir}/. Run 'python OEPS_Columnar.py export' first.")
+        else:
+            print(f"The column store in {args.dir}/ is out of date: exams were saved since it was exported. "
+                  "Run 'python OEPS_Columnar.py export' again.")
+        return
+    if args.command == "to-json":
+        count = write_json(columns, args.output)
+        print(f"Wrote {count} entries to {args.output}.")
+    else:
+        mismatches = verify(columns)
+        print("Column store matches the exam store." if not mismatches else f"{mismatches} entries differ from the exam store.")
+
+if __name__ == "__main__":
+    main()
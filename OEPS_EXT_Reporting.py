@@ -1,37 +1,70 @@
-import json
+import argparse
+import csv
 from datetime import datetime, timedelta
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
+import OEPS_Storage
+import OEPS_Profiling
+import OEPS_Index
+from OEPS_Profiling import stage
 
-DATA_FILE = "OEPS_data.json"
 OUTPUT_PDF = "EAP_Requirements_Report.pdf"
+OUTPUT_CSV = "EAP_Requirements_Report.csv"
+OUTPUT_XLSX = "EAP_Requirements_Report.xlsx"
+
+HEADER = ['Student Name', 'EAP Requirement']
+EAP_REQUIRED = "EAP 6016 Required"
+NO_EAP_REQUIRED = "No EAP Required"
+# Requirements in report order
+REQUIREMENTS = [EAP_REQUIRED, NO_EAP_REQUIRED]
+
+# Fast PDF layout: fixed-size tables with fixed column widths and row
+# heights, each small enough to fit on a page so reportlab never has to
+# measure cells or split a long table. Used from FAST_LAYOUT_MIN_ROWS rows.
+FAST_LAYOUT_MIN_ROWS = 2000
+FAST_TABLE_ROWS = 24
+FAST_COLUMN_WIDTHS = [300, 168]
+FAST_ROW_HEIGHT = 24
 
 def load_data():
-    with open(DATA_FILE, 'r') as file:
-        return json.load(file)
+    return OEPS_Storage.load_data()
 
 def determine_eap_requirement(total_score):
     if total_score < 2:
-        return "EAP 6016 Required"
+        return EAP_REQUIRED
     else:
-        return "No EAP Required"
+        return NO_EAP_REQUIRED
 
-def compile_student_list(data):
-    student_list = []
-    one_year_ago = datetime.now() - timedelta(days=365)
+def load_latest_attempts(days=365):
+    # One entry per student examined in the trailing window: their latest
+    # attempt, looked up in the student index, so a retake replaces the
+    # earlier result instead of listing the student twice
+    return OEPS_Index.latest_attempts(datetime.now() - timedelta(days=days))
+
+def group_students(data):
+    # Student names bucketed by EAP requirement in one pass. Each bucket keeps
+    # the order the entries arrived in, so the list needs no sort. The
+    # entries are already limited to the window (see load_latest_attempts).
+    groups = {requirement: [] for requirement in REQUIREMENTS}
     for entry in data:
-        assessment_date = datetime.fromisoformat(entry['date'])
-        if assessment_date >= one_year_ago:
-            student_name = entry['student']
-            total_score = entry['total score']
-            eap_requirement = determine_eap_requirement(total_score)
-            student_list.append([student_name, eap_requirement])
-    return sorted(student_list, key=lambda x: x[1])  # Sort by EAP requirement
-
-def create_pdf_report(student_list):
-    doc = SimpleDocTemplate(OUTPUT_PDF, pagesize=letter)
+        groups[determine_eap_requirement(entry['total score'])].append(entry['student'])
+    return groups
+
+def iter_rows(groups):
+    for requirement in REQUIREMENTS:
+        for student_name in groups[requirement]:
+            yield [student_name, requirement]
+
+def compile_student_list(data):
+    # Grouped by EAP requirement
+    return list(iter_rows(group_students(data)))
+
+def create_pdf_report(student_list, output=OUTPUT_PDF):
+    # reportlab is only imported once a PDF is actually built
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    doc = SimpleDocTemplate(output, pagesize=letter)
     elements = []
 
     # Add title
@@ -60,24 +93,117 @@ def create_pdf_report(student_list):
         ('GRID', (0, 0), (-1, -1), 1, colors.black)
     ])
 
-    # Add color coding based on EAP requirement
-    for i in range(1, len(table_data)):
-        if table_data[i][1] == "EAP 6016 Required":
-            style.add('BACKGROUND', (0, i), (-1, i), colors.lightpink)
-        else:
-            style.add('BACKGROUND', (0, i), (-1, i), colors.lightgreen)
+    # Add color coding based on EAP requirement, one command per run of
+    # rows with the same requirement
+    run_start = 1
+    for i in range(2, len(table_data) + 1):
+        if i == len(table_data) or table_data[i][1] != table_data[run_start][1]:
+            color = colors.lightpink if table_data[run_start][1] == EAP_REQUIRED else colors.lightgreen
+            style.add('BACKGROUND', (0, run_start), (-1, i - 1), color)
+            run_start = i
 
     table.setStyle(style)
     elements.append(table)
 
     # Build PDF
-    doc.build(elements)
+    with stage("SimpleDocTemplate.build"):
+        doc.build(elements)
+
+def create_fast_pdf_report(groups, output=OUTPUT_PDF):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    doc = SimpleDocTemplate(output, pagesize=letter)
+    styles = getSampleStyleSheet()
+    elements = [Paragraph("EAP Requirements Report", styles['Title'])]
+
+    base_style = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]
+    # One style per requirement, shared by all of its tables; rows alternate
+    # between two shades of the requirement's color
+    row_colors = {
+        EAP_REQUIRED: [colors.lightpink, colors.pink],
+        NO_EAP_REQUIRED: [colors.lightgreen, colors.palegreen],
+    }
+    for requirement in REQUIREMENTS:
+        style = TableStyle(base_style + [('ROWBACKGROUNDS', (0, 1), (-1, -1), row_colors[requirement])])
+        students = groups[requirement]
+        for start in range(0, len(students), FAST_TABLE_ROWS):
+            rows = [HEADER] + [[student_name, requirement] for student_name in students[start:start + FAST_TABLE_ROWS]]
+            elements.append(Table(rows, colWidths=FAST_COLUMN_WIDTHS, rowHeights=FAST_ROW_HEIGHT,
+                                  repeatRows=1, style=style))
+
+    with stage("SimpleDocTemplate.build"):
+        doc.build(elements)
+
+def write_csv(groups, output=OUTPUT_CSV):
+    with open(output, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(HEADER)
+        writer.writerows(iter_rows(groups))
+
+def write_xlsx(groups, output=OUTPUT_XLSX):
+    # openpyxl is optional; only needed for this output
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        print("XLSX output needs the openpyxl package (pip install openpyxl).")
+        return False
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("EAP Requirements")
+    sheet.append(HEADER)
+    for row in iter_rows(groups):
+        sheet.append(row)
+    workbook.save(output)
+    return True
+
+def generate_report(output_format='pdf', fast=None, output=None):
+    # fast: chunked PDF layout (True), single table (False), or by row count
+    with stage("load latest attempts and group students"):
+        groups = group_students(load_latest_attempts())
+    row_count = sum(len(students) for students in groups.values())
+    if output_format == 'csv':
+        output = output or OUTPUT_CSV
+        with stage("write_csv"):
+            write_csv(groups, output)
+    elif output_format == 'xlsx':
+        output = output or OUTPUT_XLSX
+        with stage("write_xlsx"):
+            if not write_xlsx(groups, output):
+                return None
+    elif fast or (fast is None and row_count >= FAST_LAYOUT_MIN_ROWS):
+        output = output or OUTPUT_PDF
+        with stage("create_fast_pdf_report"):
+            create_fast_pdf_report(groups, output)
+    else:
+        output = output or OUTPUT_PDF
+        with stage("create_pdf_report"):
+            create_pdf_report(list(iter_rows(groups)), output)
+    print(f"Report generated: {output}")
+    return output
 
-def main():
-    data = load_data()
-    student_list = compile_student_list(data)
-    create_pdf_report(student_list)
-    print(f"Report generated: {OUTPUT_PDF}")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the EAP requirements placement report.")
+    parser.add_argument("--format", choices=["pdf", "csv", "xlsx"], default="pdf",
+                        help="Output format (xlsx needs openpyxl)")
+    parser.add_argument("--fast", action="store_true", default=None,
+                        help=f"Use the paginated PDF layout (automatic from {FAST_LAYOUT_MIN_ROWS} students)")
+    parser.add_argument("--output", help="Output file (defaults to EAP_Requirements_Report.<format>)")
+    OEPS_Profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    OEPS_Profiling.run(args, generate_report, args.format, args.fast, args.output)
 
 if __name__ == "__main__":
     main()
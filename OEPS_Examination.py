@@ -1,8 +1,12 @@
 import json
+import os
 import random
 from datetime import datetime
-
-DATA_FILE = "OEPS_data.json"
+import OEPS_Storage
+import OEPS_Rollups
+import OEPS_Index
+import OEPS_Parquet
+import OEPS_Window
 
 QUESTIONS_BANK = {
     1:
@@ -29,21 +33,90 @@ QUESTIONS_BANK = {
 
 QUESTION_WEIGHTS = {1: 0.20, 2: 0.30, 3: 0.50}
 
+# In-progress exams, one file per examiner and student, saved after each
+# question and removed once the exam is stored
+DRAFT_DIR = "OEPS_drafts"
+
 def load_data():
+    return OEPS_Storage.load_data()
+
+def save_data(entry):
+    save_entries([entry])
+
+def save_entries(entries, compact_threshold=OEPS_Storage.COMPACT_THRESHOLD_BYTES):
+    # Several examiners may be saving at once; the store lock makes the
+    # append and the rollup, index, mirror and window updates one step, so no save is lost
+    with OEPS_Storage.locked():
+        # Append the finished exams to the journal instead of rewriting all history
+        OEPS_Storage.append_entries(entries, compact_threshold)
+        # Keep the quarterly report rollups current
+        OEPS_Rollups.record_entries(entries)
+        # And the search index
+        OEPS_Index.record_entries(entries)
+        # And the Parquet mirror, if one has been exported
+        OEPS_Parquet.record_entries(entries)
+        # And the rolling 365-day window behind the daily reports
+        OEPS_Window.record_entries(entries)
+
+def draft_path(examiner, student):
+    # Names are letters, spaces and hyphens only (see validate_name)
+    return os.path.join(DRAFT_DIR, f"{examiner}__{student}.json".replace(' ', '_'))
+
+def save_draft(entry):
+    os.makedirs(DRAFT_DIR, exist_ok=True)
+    path = draft_path(entry['examiner'], entry['student'])
+    tmp_file = path + ".tmp"
+    with open(tmp_file, 'w') as file:
+        json.dump(entry, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_file, path)
+
+def load_draft(examiner, student):
     try:
-        with open(DATA_FILE, 'r') as file:
+        with open(draft_path(examiner, student), 'r') as file:
             return json.load(file)
-    except FileNotFoundError:
-        return []
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
 
-def save_data(data):
-    with open(DATA_FILE, 'w') as file:
-        json.dump(data, file, indent=2)
-
-def validate_name(prompt, min_length=2):
+def discard_draft(examiner, student):
+    try:
+        os.remove(draft_path(examiner, student))
+    except FileNotFoundError:
+        pass
+
+def resume_draft(examiner, student):
+    # Offer to continue an exam left unfinished (e.g. the terminal was closed)
+    draft = load_draft(examiner, student)
+    if draft is None:
+        return None
+    answered = len(draft["questions"])
+    answer = input(f"Resume the unfinished exam of {student} started {draft['date'][:16]} "
+                   f"({answered} of 3 questions done)? (y/n): ").strip().lower()
+    if answer == 'y':
+        return draft
+    discard_draft(examiner, student)
+    return None
+
+# The rules every exam is held to, whether entered at the prompts below,
+# submitted to OEPS_Service or bulk imported with OEPS_Import
+MIN_NAME_LENGTH = 2
+MAX_SCORE = 3
+
+def valid_name(name, min_length=MIN_NAME_LENGTH):
+    return len(name) >= min_length and name.replace(' ', '').replace('-', '').isalpha()
+
+def valid_question(number, question):
+    # The question text must be one of the bank's prompts for its slot
+    return question in QUESTIONS_BANK.get(number, [])
+
+def valid_score(score):
+    return isinstance(score, int) and not isinstance(score, bool) and 0 <= score <= MAX_SCORE
+
+def validate_name(prompt, min_length=MIN_NAME_LENGTH):
     while True: 
         name = input(prompt).strip()
-        if(len(name) >= min_length and name.replace(' ', '').replace('-', '').isalpha()):
+        if valid_name(name, min_length):
             return name
         else:
             print(f"Please enter a valid name that is at least {min_length} charactes long using letters, spaces, and hypens only: ")
@@ -75,7 +148,7 @@ def get_score(prompt, max_attempts=3):
     for _ in range(max_attempts):
         try:
             score = int(input(prompt))
-            if 0 <= score <= 3:
+            if valid_score(score):
                 return score
             print("Score must be between 0 and 3: ")
         except ValueError:
@@ -105,9 +178,9 @@ def get_EAP_requirement(total_score):
     else:
         return "EAP 6016 NOT REQUIRED"
 
-def create_new_entry(examiner, student): 
-    # Set up our data entry
-    entry = {
+def create_new_entry(examiner, student, draft=None): 
+    # Set up our data entry, or pick up where a saved draft left off
+    entry = draft or {
         "examiner": examiner, 
         "student": student,
         "date": datetime.now().isoformat(),
@@ -116,9 +189,10 @@ def create_new_entry(examiner, student):
 
     # Pull the questions at random from the questions list
     # And display that question before getting notes and a score
-    # Append that data to our entry
-    for i in range(1, 4):
+    # Append that data to our entry, autosaving the draft after each one
+    for i in range(len(entry["questions"]) + 1, 4):
         entry["questions"].append(get_question_data(i))
+        save_draft(entry)
 
     # Add a total score item to our entry using helper function
     entry["total score"] = calculate_total_score(entry["questions"])
@@ -134,18 +208,15 @@ def create_new_entry(examiner, student):
     return entry
 
 def main():
-    # Start with loading the data
-    data = load_data()
     # Get the name of the examiner
     examiner = get_examiner_name()
     # Get the student examinee's name
     student = get_student_name()
     # Begin examination loop
-    new_entry = create_new_entry(examiner, student)
-    #Append new entry to loaded data
-    data.append(new_entry)
-    # Save the data to the JSON file
-    save_data(data)
+    new_entry = create_new_entry(examiner, student, resume_draft(examiner, student))
+    # Save the new entry to the data store
+    save_data(new_entry)
+    discard_draft(examiner, student)
     # Debugging printlns
     # print(data)
     # print(examiner)
@@ -0,0 +1,340 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import OEPS_Examination
+import OEPS_Index
+import OEPS_Storage
+
+# Bulk import of historical exams (paper records, spreadsheets, exports of
+# other systems) from CSV, XLSX or JSONL. Files are read in chunks; each
+# chunk is validated with the rules the interactive exam uses (valid_name,
+# valid_question and valid_score in OEPS_Examination) and has its total
+# score, band and EAP requirement computed as whole columns, then is saved
+# in batches through OEPS_Examination.save_entries, so the store, rollups,
+# search index, Parquet mirror and report window all take the batch in one
+# step under the store lock. Rows that fail validation are skipped and
+# listed in an error report.
+#
+# CSV and XLSX files have a header row with these columns (any order, extra
+# columns ignored); notes are one per line within the cell:
+#
+#   date, examiner, student, q1_question, q1_score, q1_notes, q2_..., q3_...
+#
+# JSONL files hold one exam per line in the store's own format. Total score,
+# band and EAP requirement in the input are ignored and recomputed.
+
+QUESTION_COUNT = len(OEPS_Examination.QUESTION_WEIGHTS)
+MAX_SCORE = OEPS_Examination.MAX_SCORE
+MIN_NAME_LENGTH = OEPS_Examination.MIN_NAME_LENGTH
+CHUNK_ROWS = 20_000
+# Exams per save; each batch is one journal write and one update of every derived store
+BATCH_SIZE = 20_000
+# The journal is folded into the snapshot once it passes this size rather
+# than the few megabytes of everyday saves, so a large import rewrites the
+# snapshot a handful of times instead of after every batch
+IMPORT_COMPACT_BYTES = 64 * 1024 * 1024
+FORMATS = ["csv", "xlsx", "jsonl"]
+COLUMNS = ["date", "examiner", "student"] + [f"q{i}_{field}" for i in range(1, QUESTION_COUNT + 1)
+                                             for field in ("question", "score", "notes")]
+REQUIRED_COLUMNS = [column for column in COLUMNS if not column.endswith("_notes")]
+
+def _score_tables():
+    # Total score, band and EAP requirement for every combination of question
+    # scores, computed once with the interactive exam's own functions; a
+    # batch then looks its rows up by combination
+    combinations = list(itertools.product(range(MAX_SCORE + 1), repeat=QUESTION_COUNT))
+    totals = [OEPS_Examination.calculate_total_score([{"question score": score} for score in scores])
+              for scores in combinations]
+    bands = [OEPS_Examination.determine_band(total) for total in totals]
+    eap = [OEPS_Examination.get_EAP_requirement(total) for total in totals]
+    return np.array(totals), np.array(bands, dtype=object), np.array(eap, dtype=object)
+
+TOTALS, BANDS, EAP_REQUIREMENTS = _score_tables()
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return {"json": "jsonl", "xlsm": "xlsx"}.get(extension, extension)
+
+def _cell(value):
+    # Every input value becomes text (empty for missing) before validation
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, list):
+        return "\n".join(map(str, value))
+    return str(value)
+
+def _normalize_header(header):
+    return [_cell(name).strip().lower() for name in header]
+
+def read_csv(path, chunk_rows=CHUNK_ROWS):
+    # (first row number, DataFrame of text) per chunk; row numbers count the
+    # header as row 1, as a spreadsheet shows them
+    row = 2
+    reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows, encoding='utf-8-sig')
+    for chunk in reader:
+        chunk.columns = _normalize_header(chunk.columns)
+        yield row, chunk
+        row += len(chunk)
+
+def read_xlsx(path, chunk_rows=CHUNK_ROWS, sheet=None):
+    # openpyxl is only needed for spreadsheets
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        if sheet and sheet not in workbook.sheetnames:
+            raise ValueError(f"{path} has no worksheet named {sheet} (it has {', '.join(workbook.sheetnames)}).")
+        rows = (workbook[sheet] if sheet else workbook.active).iter_rows(values_only=True)
+        header = _normalize_header(next(rows, []))
+        row = 2
+        while True:
+            chunk = [[_cell(value) for value in values] for values in itertools.islice(rows, chunk_rows)]
+            if not chunk:
+                return
+            yield row, pd.DataFrame(chunk, columns=header)
+            row += len(chunk)
+    finally:
+        workbook.close()
+
+def _flatten(entry):
+    # A store-format exam as one row of the CSV layout
+    row = {"date": entry.get('date'), "examiner": entry.get('examiner'), "student": entry.get('student')}
+    for i, question in enumerate(entry.get('questions') or [], 1):
+        if i > QUESTION_COUNT or not isinstance(question, dict):
+            break
+        row[f"q{i}_question"] = question.get('question')
+        row[f"q{i}_score"] = question.get('question score')
+        row[f"q{i}_notes"] = question.get('notes')
+    return {column: _cell(row.get(column)) for column in COLUMNS}
+
+def read_jsonl(path, chunk_rows=CHUNK_ROWS, unreadable=None):
+    # (line numbers, DataFrame of text) per chunk. Lines that are not a JSON
+    # object are added to unreadable as error rows and left out.
+    unreadable = [] if unreadable is None else unreadable
+    with open(path, 'r', encoding='utf-8') as file:
+        lines = enumerate(file, 1)
+        while True:
+            chunk = list(itertools.islice(lines, chunk_rows))
+            if not chunk:
+                return
+            numbers, rows = [], []
+            for number, line in chunk:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError as e:
+                    unreadable.append((number, "", line.strip()[:80], f"Unreadable JSON ({e.msg})."))
+                    continue
+                if not isinstance(entry, dict):
+                    unreadable.append((number, "", line.strip()[:80], "Not a JSON object."))
+                    continue
+                numbers.append(number)
+                rows.append(_flatten(entry))
+            if rows:
+                yield numbers, pd.DataFrame(rows, columns=COLUMNS)
+
+def read_chunks(path, file_format, chunk_rows=CHUNK_ROWS, sheet=None, unreadable=None):
+    # (row numbers, DataFrame of text columns) per chunk
+    if file_format == "jsonl":
+        yield from read_jsonl(path, chunk_rows, unreadable)
+        return
+    chunks = read_xlsx(path, chunk_rows, sheet) if file_format == "xlsx" else read_csv(path, chunk_rows)
+    for first_row, chunk in chunks:
+        yield range(first_row, first_row + len(chunk)), chunk
+
+def _passes(column, rule):
+    # Whether each value of a column passes one of OEPS_Examination's rules.
+    # Names and question texts repeat, so each distinct value is checked once.
+    return column.isin([value for value in column.dropna().unique() if rule(value)])
+
+def validate(chunk, row_numbers, known_examiners=()):
+    # Returns (the chunk's valid rows, cleaned; their question scores; their
+    # row numbers; error rows as (row number, column, value, message)).
+    # Every check runs on whole columns.
+    checks = []
+    columns = {}
+    for name in ("examiner", "student"):
+        # Letters, spaces and hyphens, at least MIN_NAME_LENGTH long. Examiners
+        # already in the store are accepted as stored (e.g. "Natalia D.").
+        names = chunk[name].str.strip()
+        valid = _passes(names, OEPS_Examination.valid_name)
+        if name == "examiner":
+            valid |= names.isin(known_examiners)
+        checks.append((name, ~valid, f"Name must be at least {MIN_NAME_LENGTH} characters long using letters, spaces, and hyphens only."))
+        columns[name] = names
+
+    # Dates: ISO 8601 without a time zone, as the exams record them. Each
+    # distinct value is parsed once; any that parses with an offset is an error.
+    dates = chunk["date"].str.strip()
+    local, zoned = {}, set()
+    for value in dates.dropna().unique():
+        try:
+            date = datetime.fromisoformat(value)
+        except ValueError:
+            continue
+        if date.tzinfo is None:
+            local[value] = date
+        else:
+            zoned.add(value)
+    zoned = dates.isin(zoned)
+    parsed = pd.to_datetime(dates.map(local))
+    checks.append(("date", parsed.isna() & ~zoned, "Date must be an ISO 8601 date or date and time (e.g. 2019-04-23 or 2019-04-23T14:30:00)."))
+    checks.append(("date", zoned, "Date must be in local time, without a time zone."))
+    columns["date"] = parsed
+
+    scores = []
+    for i in range(1, QUESTION_COUNT + 1):
+        # One of the question bank's prompts for this slot
+        questions = chunk[f"q{i}_question"].str.strip()
+        missing = questions.str.len() == 0
+        checks.append((f"q{i}_question", missing, f"Question {i} text is missing."))
+        in_bank = _passes(questions, lambda question: OEPS_Examination.valid_question(i, question))
+        checks.append((f"q{i}_question", ~missing & ~in_bank, f"Question {i} text is not in the question bank for question {i}."))
+        columns[f"q{i}_question"] = questions
+        # A whole number from 0 to MAX_SCORE
+        text = chunk[f"q{i}_score"].str.strip()
+        whole = text.str.fullmatch(r"[+-]?\d+")
+        values = pd.to_numeric(text.where(whole), errors='coerce')
+        in_range = _passes(values, lambda score: OEPS_Examination.valid_score(int(score)))
+        checks.append((f"q{i}_score", ~in_range, f"Question {i} score must be a whole number between 0 and {MAX_SCORE}."))
+        scores.append(values)
+        if f"q{i}_notes" in chunk:
+            columns[f"q{i}_notes"] = chunk[f"q{i}_notes"]
+
+    row_numbers = np.asarray(row_numbers)
+    invalid = np.zeros(len(chunk), dtype=bool)
+    errors = []
+    for column, failed, message in checks:
+        failed = failed.to_numpy(dtype=bool)
+        invalid |= failed
+        errors += [(row, column, value, message) for row, value in zip(row_numbers[failed], chunk[column].to_numpy()[failed])]
+    errors.sort(key=lambda error: error[0])
+
+    keep = ~invalid
+    valid = pd.DataFrame({name: column.to_numpy()[keep] for name, column in columns.items()})
+    score_array = np.column_stack([values.to_numpy()[keep] for values in scores]).astype(np.int64) if keep.any() \
+        else np.zeros((0, QUESTION_COUNT), dtype=np.int64)
+    return valid, score_array, row_numbers[keep], errors
+
+def _split_notes(text):
+    return [note.strip() for note in text.splitlines() if note.strip()]
+
+def build_entries(valid, scores):
+    # Store-format exams for validated rows, with the derived fields looked
+    # up for the whole batch at once
+    combination = np.zeros(len(valid), dtype=np.int64)
+    for i in range(QUESTION_COUNT):
+        combination = combination * (MAX_SCORE + 1) + scores[:, i]
+    totals = TOTALS[combination].tolist()
+    bands = BANDS[combination].tolist()
+    eap = EAP_REQUIREMENTS[combination].tolist()
+    dates = [date.isoformat() for date in valid["date"].dt.to_pydatetime()]
+    questions = []
+    for i in range(QUESTION_COUNT):
+        notes = valid[f"q{i+1}_notes"].tolist() if f"q{i+1}_notes" in valid else [""] * len(valid)
+        questions.append(zip(valid[f"q{i+1}_question"].tolist(), notes, scores[:, i].tolist()))
+    entries = []
+    for examiner, student, date, total, band, requirement, *asked in zip(
+            valid["examiner"].tolist(), valid["student"].tolist(), dates, totals, bands, eap, *questions):
+        entries.append({
+            "examiner": examiner,
+            "student": student,
+            "date": date,
+            "questions": [{"question": question, "notes": _split_notes(notes), "question score": score}
+                          for question, notes, score in asked],
+            "total score": total,
+            "band": band,
+            "EAP requirement": requirement,
+        })
+    return entries
+
+def existing_keys():
+    # Date, examiner and student of every stored exam, read from the search
+    # index, so that running an interrupted import again does not store its
+    # first rows twice
+    return OEPS_Index.exam_keys()
+
+def write_errors(path, errors):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["row", "column", "value", "message"])
+        writer.writerows(errors)
+
+def import_file(path, file_format=None, batch_size=BATCH_SIZE, sheet=None, dry_run=False, errors_path=None):
+    # Returns (exams imported, error rows). Each batch is saved as one step;
+    # rows are imported in file order.
+    file_format = file_format or detect_format(path)
+    if file_format not in FORMATS:
+        raise ValueError(f"Unsupported file format: {file_format}. Use one of {', '.join(FORMATS)}.")
+    errors = []
+    seen = existing_keys()
+    known_examiners = {examiner for _, examiner, _ in seen}
+    pending = []
+    imported = 0
+    for row_numbers, chunk in read_chunks(path, file_format, sheet=sheet, unreadable=errors):
+        missing = [column for column in REQUIRED_COLUMNS if column not in chunk]
+        if missing:
+            raise ValueError(f"{path} is missing the column(s): {', '.join(missing)}.")
+        valid, scores, valid_rows, chunk_errors = validate(chunk, row_numbers, known_examiners)
+        errors += chunk_errors
+        for row, entry in zip(valid_rows.tolist(), build_entries(valid, scores)):
+            key = OEPS_Storage.entry_key(entry)
+            if key in seen:
+                errors.append((row, "date", entry['date'], "Same date, examiner and student as an exam already stored or earlier in the file."))
+                continue
+            seen.add(key)
+            pending.append(entry)
+        while len(pending) >= batch_size:
+            if not dry_run:
+                OEPS_Examination.save_entries(pending[:batch_size], IMPORT_COMPACT_BYTES)
+            imported += batch_size
+            pending = pending[batch_size:]
+    if pending and not dry_run:
+        OEPS_Examination.save_entries(pending, IMPORT_COMPACT_BYTES)
+    imported += len(pending)
+    if imported and not dry_run:
+        # Leave the journal no larger than everyday saves would
+        OEPS_Storage.compact_if_needed()
+    errors.sort(key=lambda error: error[0])
+    if errors and errors_path:
+        write_errors(errors_path, errors)
+    return imported, errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Import historical exams from CSV, XLSX or JSONL files.")
+    parser.add_argument("path", help="File to import")
+    parser.add_argument("--format", choices=FORMATS, help="File format (default: from the file extension)")
+    parser.add_argument("--sheet", help="Worksheet to read from an XLSX file (default: the active one)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Exams saved per batch")
+    parser.add_argument("--errors", help="Error report (CSV) for rejected rows (default: <path>.errors.csv)")
+    parser.add_argument("--dry-run", action="store_true", help="Validate only; store nothing")
+    args = parser.parse_args()
+
+    errors_path = args.errors or args.path + ".errors.csv"
+    started = time.perf_counter()
+    try:
+        imported, errors = import_file(args.path, args.format, args.batch_size, args.sheet, args.dry_run, errors_path)
+    except FileNotFoundError:
+        print(f"File not found: {args.path}")
+        return
+    except ImportError as e:
+        print(f"Reading this file needs the {e.name} package (pip install {e.name}).")
+        return
+    except ValueError as e:
+        print(e)
+        return
+    seconds = time.perf_counter() - started
+    verb = "Validated" if args.dry_run else "Imported"
+    print(f"{verb} {imported} exams from {args.path} in {seconds:.1f}s ({imported / max(seconds, 1e-9):,.0f} per second).")
+    if errors:
+        rows = len({error[0] for error in errors})
+        print(f"{rows} rows rejected; see {errors_path}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+import OEPS_Storage
+
+# Search index over the exam store in a SQLite file. Student names, notes and
+# question texts repeat constantly, so each distinct text is stored once and
+# exams refer to it by id; student names and notes are full-text indexed
+# (FTS5) so lookups by word or phrase never scan the exams themselves.
+#
+# Students are also keyed by a normalized name (see student_key), so retakes
+# written with different spacing or capitalization are one student. The
+# students table holds each student's latest attempt, which is the one that
+# decides placement.
+
+INDEX_FILE = "OEPS_index.sqlite"
+# Bump when the schema changes; an index from another version is rebuilt
+INDEX_VERSION = 2
+# Seconds to wait for another connection's write to finish
+BUSY_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE exams (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    examiner TEXT NOT NULL,
+    student_id INTEGER NOT NULL,
+    student_key TEXT NOT NULL,
+    total_score REAL,
+    band TEXT,
+    eap TEXT
+);
+CREATE TABLE students (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    latest_exam_id INTEGER NOT NULL,
+    latest_date TEXT NOT NULL
+);
+CREATE TABLE student_names (id INTEGER PRIMARY KEY, text TEXT UNIQUE NOT NULL);
+CREATE TABLE note_texts (id INTEGER PRIMARY KEY, text TEXT UNIQUE NOT NULL);
+CREATE TABLE question_texts (id INTEGER PRIMARY KEY, text TEXT UNIQUE NOT NULL);
+CREATE TABLE exam_questions (exam_id INTEGER NOT NULL, number INTEGER NOT NULL, text_id INTEGER NOT NULL, score REAL);
+CREATE TABLE exam_notes (exam_id INTEGER NOT NULL, number INTEGER NOT NULL, note_id INTEGER NOT NULL);
+CREATE VIRTUAL TABLE student_search USING fts5(text);
+CREATE VIRTUAL TABLE note_search USING fts5(text);
+CREATE INDEX exams_date ON exams (date);
+CREATE INDEX exams_student ON exams (student_id);
+CREATE INDEX exams_student_key ON exams (student_key, date);
+CREATE INDEX students_latest ON students (latest_date);
+CREATE INDEX exams_examiner ON exams (examiner COLLATE NOCASE);
+CREATE INDEX exam_questions_text ON exam_questions (text_id, number);
+CREATE INDEX exam_notes_note ON exam_notes (note_id, number);
+"""
+
+# Lookup table -> full-text table kept alongside it
+SEARCHABLE = {"student_names": "student_search", "note_texts": "note_search", "question_texts": None}
+
+def _connect(path):
+    # Imported here so starting an exam (which imports this module) does not load sqlite3
+    import sqlite3
+    return sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+
+def open_index():
+    # The index connection, or None if there is no current index
+    if not os.path.exists(INDEX_FILE):
+        return None
+    connection = _connect(INDEX_FILE)
+    if connection.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+        connection.close()
+        return None
+    return connection
+
+def _text_id(connection, cache, table, text):
+    text_id = cache.get(text)
+    if text_id is None:
+        row = connection.execute(f"SELECT id FROM {table} WHERE text = ?", (text,)).fetchone()
+        if row:
+            text_id = row[0]
+        else:
+            text_id = connection.execute(f"INSERT INTO {table} (text) VALUES (?)", (text,)).lastrowid
+            if SEARCHABLE[table]:
+                connection.execute(f"INSERT INTO {SEARCHABLE[table]} (rowid, text) VALUES (?, ?)", (text_id, text))
+        cache[text] = text_id
+    return text_id
+
+def student_key(name):
+    # Case and spacing do not distinguish students
+    return " ".join(name.split()).casefold()
+
+def _record_attempt(connection, key, name, exam_id, date):
+    # Count the attempt; it becomes the student's latest unless an exam
+    # with a later date was already recorded
+    updated = connection.execute("UPDATE students SET attempts = attempts + 1 WHERE key = ?", (key,)).rowcount
+    if not updated:
+        connection.execute("INSERT INTO students VALUES (?, ?, 1, ?, ?)", (key, name, exam_id, date))
+        return
+    connection.execute("UPDATE students SET name = ?, latest_exam_id = ?, latest_date = ? WHERE key = ? AND latest_date <= ?",
+                       (name, exam_id, date, key, date))
+
+def add_entries(connection, entries):
+    # Index entries inside the caller's transaction
+    caches = {table: {} for table in SEARCHABLE}
+    count = 0
+    for entry in entries:
+        student_id = _text_id(connection, caches["student_names"], "student_names", entry['student'])
+        key = student_key(entry['student'])
+        date = OEPS_Storage.entry_date(entry).isoformat()
+        exam_id = connection.execute(
+            "INSERT INTO exams (date, examiner, student_id, student_key, total_score, band, eap) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (date, entry['examiner'], student_id, key, entry.get('total score'), entry.get('band'),
+             entry.get('EAP requirement'))).lastrowid
+        _record_attempt(connection, key, entry['student'], exam_id, date)
+        questions, notes = [], []
+        for number, question in enumerate(entry['questions'], 1):
+            text_id = _text_id(connection, caches["question_texts"], "question_texts", question['question'])
+            questions.append((exam_id, number, text_id, question.get('question score')))
+            for note in question.get('notes', []):
+                notes.append((exam_id, number, _text_id(connection, caches["note_texts"], "note_texts", note)))
+        connection.executemany("INSERT INTO exam_questions VALUES (?, ?, ?, ?)", questions)
+        connection.executemany("INSERT INTO exam_notes VALUES (?, ?, ?)", notes)
+        count += 1
+    return count
+
+def rebuild():
+    # Full rescan of the store into a fresh file, swapped in when complete.
+    # Holds the store lock so no exam is saved between the scan and the swap.
+    with OEPS_Storage.locked():
+        return _rebuild()
+
+def _rebuild():
+    tmp_file = INDEX_FILE + ".tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    connection = _connect(tmp_file)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(SCHEMA)
+        with connection:
+            count = add_entries(connection, OEPS_Storage.iter_entries())
+        connection.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        connection.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        connection.close()
+    os.replace(tmp_file, INDEX_FILE)
+    return count
+
+def record_entry(entry):
+    record_entries([entry])
+
+def record_entries(entries):
+    connection = open_index()
+    if connection is None:
+        # As with the rollups, the first save after an upgrade builds the
+        # index from scratch, including the entries just appended
+        rebuild()
+        return
+    try:
+        with connection:
+            add_entries(connection, entries)
+    finally:
+        connection.close()
+
+def open_or_rebuild():
+    connection = open_index()
+    if connection is None:
+        rebuild()
+        connection = open_index()
+    return connection
+
+def exam_keys():
+    # (date, examiner, student) of every exam, as OEPS_Storage.entry_key
+    # gives them for dates written by isoformat()
+    connection = open_or_rebuild()
+    try:
+        return set(connection.execute(
+            "SELECT exams.date, exams.examiner, student_names.text FROM exams "
+            "JOIN student_names ON student_names.id = exams.student_id"))
+    finally:
+        connection.close()
+
+def _phrase(text):
+    # Quote user text as a single FTS5 phrase so punctuation is not parsed as syntax
+    return '"' + text.replace('"', '""') + '"'
+
+def search(note=None, student=None, examiner=None, question=None, question_number=None,
+           start_date=None, end_date=None, limit=None, connection=None):
+    # Exams matching every given filter, oldest first:
+    #   note             phrase found in a note (e.g. "speech was too fast")
+    #   student          word or phrase in the student's name
+    #   examiner         examiner name, ignoring case
+    #   question         text contained in the question asked
+    #   question_number  restrict note/question matches to question 1, 2 or 3
+    #   start/end_date   start_date <= date <= end_date
+    # Each result has the exam's date, examiner, student, total score and band,
+    # plus the matching notes as (question number, note) pairs.
+    own_connection = connection is None
+    if own_connection:
+        connection = open_or_rebuild()
+
+    conditions, params = [], []
+    if student:
+        conditions.append("e.student_id IN (SELECT rowid FROM student_search WHERE student_search MATCH ?)")
+        params.append(_phrase(student))
+    if examiner:
+        conditions.append("e.examiner = ? COLLATE NOCASE")
+        params.append(examiner)
+    if question:
+        number_filter = " AND q.number = ?" if question_number else ""
+        conditions.append("e.id IN (SELECT q.exam_id FROM exam_questions q WHERE q.text_id IN "
+                          "(SELECT id FROM question_texts WHERE instr(lower(text), lower(?)))" + number_filter + ")")
+        params.append(question)
+        if question_number:
+            params.append(question_number)
+    if start_date:
+        conditions.append("e.date >= ?")
+        params.append(start_date.isoformat())
+    if end_date:
+        conditions.append("e.date <= ?")
+        params.append(end_date.isoformat())
+
+    columns = "e.id, e.date, e.examiner, s.text, e.total_score, e.band"
+    if note:
+        # One row per matching note, grouped back into exams below
+        sql = (f"SELECT {columns}, n.number, t.text FROM exam_notes n "
+               "JOIN exams e ON e.id = n.exam_id JOIN note_texts t ON t.id = n.note_id "
+               "JOIN student_names s ON s.id = e.student_id "
+               "WHERE n.note_id IN (SELECT rowid FROM note_search WHERE note_search MATCH ?)")
+        params.insert(0, _phrase(note))
+        if question_number:
+            sql += " AND n.number = ?"
+            params.insert(1, question_number)
+    else:
+        sql = f"SELECT {columns}, NULL, NULL FROM exams e JOIN student_names s ON s.id = e.student_id WHERE 1"
+    for condition in conditions:
+        sql += " AND " + condition
+    sql += " ORDER BY e.date, e.id"
+
+    results = []
+    try:
+        for exam_id, date, examiner_name, student_name, total_score, band, number, text in connection.execute(sql, params):
+            if not results or results[-1]["id"] != exam_id:
+                if limit is not None and len(results) == limit:
+                    break
+                results.append({"id": exam_id, "date": date, "examiner": examiner_name, "student": student_name,
+                                "total score": total_score, "band": band, "matches": []})
+            if text is not None:
+                results[-1]["matches"].append((number, text))
+    finally:
+        if own_connection:
+            connection.close()
+    return results
+
+def _connection_call(connection, function):
+    if connection is not None:
+        return function(connection)
+    connection = open_or_rebuild()
+    try:
+        return function(connection)
+    finally:
+        connection.close()
+
+ATTEMPT_COLUMNS = "e.date, e.examiner, s.text, e.total_score, e.band, e.eap"
+
+def _attempt(row):
+    date, examiner, student, total_score, band, eap = row
+    return {"date": date, "examiner": examiner, "student": student, "total score": total_score,
+            "band": band, "EAP requirement": eap}
+
+def current_status(student, connection=None):
+    # The student's latest attempt plus their number of attempts, or None.
+    # One primary key lookup whatever the number of exams.
+    def lookup(connection):
+        row = connection.execute(
+            f"SELECT {ATTEMPT_COLUMNS}, st.attempts FROM students st JOIN exams e ON e.id = st.latest_exam_id "
+            "JOIN student_names s ON s.id = e.student_id WHERE st.key = ?", (student_key(student),)).fetchone()
+        if row is None:
+            return None
+        return dict(_attempt(row[:-1]), attempts=row[-1])
+    return _connection_call(connection, lookup)
+
+def attempt_history(student, connection=None):
+    # Every attempt by the student, oldest first
+    def lookup(connection):
+        return [_attempt(row) for row in connection.execute(
+            f"SELECT {ATTEMPT_COLUMNS} FROM exams e JOIN student_names s ON s.id = e.student_id "
+            "WHERE e.student_key = ? ORDER BY e.date, e.id", (student_key(student),))]
+    return _connection_call(connection, lookup)
+
+def latest_attempts(start_date=None, connection=None):
+    # Each student's latest attempt, for students whose latest attempt is
+    # dated on or after start_date, oldest first
+    def lookup(connection):
+        return [_attempt(row) for row in connection.execute(
+            f"SELECT {ATTEMPT_COLUMNS} FROM students st JOIN exams e ON e.id = st.latest_exam_id "
+            "JOIN student_names s ON s.id = e.student_id WHERE st.latest_date >= ? ORDER BY st.latest_date, e.id",
+            ((start_date or datetime.min).isoformat(),))]
+    return _connection_call(connection, lookup)
+
+def load_entries(results):
+    # The full stored entries for search results, in the same order
+    entries = []
+    for result in results:
+        date = datetime.fromisoformat(result["date"])
+        key = (result["examiner"], result["student"])
+        entries.extend(entry for entry in OEPS_Storage.iter_range(date, date)
+                       if (entry['examiner'], entry['student']) == key)
+    return entries
+
+def parse_day(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date: {value}. Use YYYY-MM-DD.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Search OEPS exams by note, student, examiner or question.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="Rebuild the index from the exam store")
+    search_parser = subparsers.add_parser("search", help="Find exams matching every given filter")
+    search_parser.add_argument("--note", help="Phrase in an examiner note")
+    search_parser.add_argument("--student", help="Word or phrase in the student's name")
+    search_parser.add_argument("--examiner", help="Examiner name")
+    search_parser.add_argument("--question", help="Text in the question asked")
+    search_parser.add_argument("--question-number", type=int, choices=[1, 2, 3], help="Only match notes/questions for this question")
+    search_parser.add_argument("--since", type=parse_day, help="First exam date (YYYY-MM-DD)")
+    search_parser.add_argument("--until", type=parse_day, help="Last exam date (YYYY-MM-DD, inclusive)")
+    search_parser.add_argument("--limit", type=int, help="Maximum number of exams")
+    search_parser.add_argument("--full", action="store_true", help="Print the full stored entries as JSON")
+    student_parser = subparsers.add_parser("student", help="Show a student's current EAP status and attempt history")
+    student_parser.add_argument("name", help="Student name (case and spacing are ignored)")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        count = rebuild()
+        print(f"Indexed {count} exams in {INDEX_FILE}.")
+        return
+
+    if args.command == "student":
+        status = current_status(args.name)
+        if status is None:
+            print(f"No exams found for {args.name}.")
+            return
+        print(f"{status['student']}: {status['EAP requirement']} (latest of {status['attempts']} attempt(s), "
+              f"{status['date'][:10]}, score {status['total score']})")
+        for attempt in attempt_history(args.name):
+            print(f"  {attempt['date'][:10]}  {attempt['examiner']:<12} {attempt['total score']:>5}  {attempt['band']}")
+        return
+
+    until = args.until + timedelta(days=1) - timedelta(microseconds=1) if args.until else None
+    results = search(args.note, args.student, args.examiner, args.question, args.question_number,
+                     args.since, until, args.limit)
+    if args.full:
+        print(json.dumps(load_entries(results), indent=2))
+        return
+    for result in results:
+        print(f"{result['date'][:10]}  {result['student']:<28} {result['examiner']:<12} "
+              f"{result['total score']:>5}  {result['band']}")
+        for number, text in result["matches"]:
+            print(f"    Q{number}: {text}")
+    print(f"{len(results)} exam(s) found.")
+
+if __name__ == "__main__":
+    main()
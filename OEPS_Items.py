@@ -0,0 +1,130 @@
+# Item analysis of the question prompts. Every prompt drawn from the
+# question bank for a slot (Question 1, 2 or 3) is an item. An item's
+# statistics are kept as plain sums (responses, score sum and sum of
+# squares, total score sum and sum of squares, and the cross product of
+# score and total), so they can be stored in the quarterly rollups, merged
+# across quarters and turned into difficulty and discrimination for any
+# period without going back to the exams. Only item_sums and analyze use
+# numpy, and import it themselves, since the rollups update items on every
+# save.
+
+QUESTION_COUNT = 3
+MAX_QUESTION_SCORE = 3
+SUM_FIELDS = ["count", "score_sum", "score_sq_sum", "total_sum", "total_sq_sum", "cross_sum"]
+# Variances below this are treated as zero (no discrimination can be computed)
+MIN_VARIANCE = 1e-12
+
+def item_key(slot, question):
+    return f"Q{slot} {question}"
+
+def new_item(slot, question):
+    item = {"slot": slot, "question": question, "scores": {}}
+    item.update(dict.fromkeys(SUM_FIELDS, 0))
+    return item
+
+def _update(items, slot, question, score, total, sign):
+    key = item_key(slot, question)
+    item = items.get(key)
+    if item is None:
+        item = items[key] = new_item(slot, question)
+    for field, value in zip(SUM_FIELDS, (1, score, score * score, total, total * total, score * total)):
+        item[field] += sign * value
+    score_key = str(score)
+    item["scores"][score_key] = item["scores"].get(score_key, 0) + sign
+    if not item["scores"][score_key]:
+        del item["scores"][score_key]
+    if not item["count"]:
+        del items[key]
+
+def add_response(items, slot, question, score, total):
+    _update(items, slot, question, score, total, 1)
+
+def remove_response(items, slot, question, score, total):
+    # Undo add_response; an item left with no responses is removed
+    _update(items, slot, question, score, total, -1)
+
+def merge_items(target, other):
+    for key, item in other.items():
+        merged = target.setdefault(key, new_item(item["slot"], item["question"]))
+        for field in SUM_FIELDS:
+            merged[field] += item[field]
+        for score, count in item["scores"].items():
+            merged["scores"][score] = merged["scores"].get(score, 0) + count
+    return target
+
+def item_sums(frame):
+    # The same sums as add_response over every exam in the frame, with array
+    # operations. The prompt columns p1..p3 hold the question texts (ideally
+    # as categoricals); the texts are encoded once into item ids shared by
+    # all three slots.
+    import numpy as np
+    keys, lookup = [], {}
+    item_ids, scores = [], []
+    for slot in range(1, QUESTION_COUNT + 1):
+        column = frame[f'p{slot}'].astype('category')
+        ids = []
+        for question in column.cat.categories:
+            key = (slot, question)
+            if key not in lookup:
+                lookup[key] = len(keys)
+                keys.append(key)
+            ids.append(lookup[key])
+        # Code -1 (no prompt) picks the trailing -1
+        item_ids.append(np.array(ids + [-1], dtype=np.int64)[column.cat.codes.to_numpy()])
+        scores.append(frame[f'q{slot}'].to_numpy(dtype=float))
+    item_ids = np.concatenate(item_ids)
+    scores = np.concatenate(scores)
+    totals = np.tile(frame['score'].to_numpy(dtype=float), QUESTION_COUNT)
+    answered = (item_ids >= 0) & ~np.isnan(scores)
+    item_ids, scores, totals = item_ids[answered], scores[answered], totals[answered]
+
+    sums = {field: np.bincount(item_ids, weights, minlength=len(keys))
+            for field, weights in zip(SUM_FIELDS, (None, scores, scores * scores, totals, totals * totals, scores * totals))}
+    # Score shares: each (item, score) pair counted under one combined code
+    score_values, score_codes = np.unique(scores, return_inverse=True)
+    pair_counts = np.bincount(item_ids * len(score_values) + score_codes,
+                              minlength=len(keys) * len(score_values)).reshape(len(keys), len(score_values))
+
+    items = {}
+    for item_id, (slot, question) in enumerate(keys):
+        if not sums["count"][item_id]:
+            continue
+        item = items[item_key(slot, question)] = new_item(slot, question)
+        item["count"] = int(sums["count"][item_id])
+        for field in SUM_FIELDS[1:]:
+            item[field] = float(sums[field][item_id])
+    score_keys = [str(int(score) if score == int(score) else float(score)) for score in score_values]
+    for item_id, score_code in zip(*np.nonzero(pair_counts)):
+        slot, question = keys[item_id]
+        items[item_key(slot, question)]["scores"][score_keys[score_code]] = int(pair_counts[item_id, score_code])
+    return items
+
+def analyze(items):
+    # One row per item, by slot then prompt: responses, mean score,
+    # difficulty (the mean as a share of the maximum score, so lower is
+    # harder), discrimination (correlation of the item score with the total
+    # score; None when either does not vary) and the share of each score
+    import numpy as np
+    rows = sorted(items.values(), key=lambda item: (item["slot"], item["question"]))
+    if not rows:
+        return []
+    count, score_sum, score_sq_sum, total_sum, total_sq_sum, cross_sum = np.array(
+        [[item[field] for field in SUM_FIELDS] for item in rows], dtype=float).T
+    mean = score_sum / count
+    total_mean = total_sum / count
+    score_var = score_sq_sum / count - mean ** 2
+    total_var = total_sq_sum / count - total_mean ** 2
+    covariance = cross_sum / count - mean * total_mean
+    varies = (score_var > MIN_VARIANCE) & (total_var > MIN_VARIANCE)
+    discrimination = np.full(len(rows), np.nan)
+    discrimination[varies] = covariance[varies] / np.sqrt(score_var[varies] * total_var[varies])
+
+    return [{
+        "slot": item["slot"],
+        "question": item["question"],
+        "count": int(count[i]),
+        "mean": float(mean[i]),
+        "difficulty": float(mean[i] / MAX_QUESTION_SCORE),
+        "discrimination": float(discrimination[i]) if varies[i] else None,
+        "scores": {score: float(item["scores"][score] / count[i]) for score in sorted(item["scores"], key=float)},
+    } for i, item in enumerate(rows)]
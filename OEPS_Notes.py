@@ -0,0 +1,72 @@
+import heapq
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from functools import lru_cache
+
+STOP_WORDS = set([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'he',
+    'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the', 'to', 'was', 'were', 'will',
+    'with', 'i', 'you', 'your', 'we', 'they', 'them', 'their', 'this', 'these', 'those',
+    'am', 'have', 'had', 'do', 'does', 'did', 'but', 'or', 'not', 'no', 'so', 'what', 'which'
+])
+
+# Words are letters in any script with inner apostrophes or hyphens
+# ("doesn't", "well-organized", "naïve"); surrounding punctuation is dropped,
+# so "aids." and "aids" count as the same word. Notes are NFC-normalized
+# first so an accent typed as a combining mark does not split a word.
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:['-][^\W\d_]+)*")
+MIN_WORD_LENGTH = 4
+
+# Distinct notes held before they are folded into the term counts
+FLUSH_THRESHOLD = 100_000
+
+# Process-wide interning of words to small integer ids
+_word_ids = {}
+_words = []
+
+def _intern(word):
+    word_id = _word_ids.get(word)
+    if word_id is None:
+        word_id = _word_ids[word] = len(_words)
+        _words.append(word)
+    return word_id
+
+@lru_cache(maxsize=65536)
+def note_words(note):
+    # Lowercased words of at least four letters, stop words removed
+    return tuple(word for word in WORD_PATTERN.findall(unicodedata.normalize('NFC', note.lower()))
+                 if len(word) >= MIN_WORD_LENGTH and word not in STOP_WORDS)
+
+@lru_cache(maxsize=65536)
+def note_word_ids(note):
+    return tuple(_intern(word) for word in note_words(note))
+
+# A word counter is a dict with the raw notes seen since the last flush
+# (standard phrases repeat constantly, so each distinct note is tokenized
+# once however often it occurs) and an array of counts indexed by word id.
+
+def new_word_counter():
+    return {"pending": Counter(), "counts": array('q')}
+
+def add_notes(counter, notes):
+    counter["pending"].update(notes)
+    if len(counter["pending"]) >= FLUSH_THRESHOLD:
+        _flush(counter)
+
+def _flush(counter):
+    counts = counter["counts"]
+    for note, occurrences in counter["pending"].items():
+        for word_id in note_word_ids(note):
+            if word_id >= len(counts):
+                counts.extend([0] * (len(_words) - len(counts)))
+            counts[word_id] += occurrences
+    counter["pending"].clear()
+
+def word_frequencies(counter):
+    _flush(counter)
+    return {_words[word_id]: count for word_id, count in enumerate(counter["counts"]) if count}
+
+def top_words(frequencies, n=10):
+    return heapq.nlargest(n, frequencies.items(), key=lambda item: item[1])
@@ -0,0 +1,226 @@
+import argparse
+import itertools
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+import OEPS_Storage
+
+# Parquet mirror of the exam store for analytics, one directory per year
+# (OEPS_parquet/year=2024/*.parquet, Hive-style), so pandas, DuckDB, R or
+# Spark can read the data without parsing the JSON. Each exam is one row;
+# each question has its text, score and notes (a list) in its own columns.
+# Reports read a date range with the filter pushed down to the files: years
+# outside the range are skipped by directory and row groups by their date
+# statistics.
+#
+# pyarrow is optional. The mirror exists once exported; from then on every
+# save adds a small file to its year, and a year's files are merged into one
+# when they pile up.
+
+PARQUET_DIR = "OEPS_parquet"
+# Leading underscore: dataset readers skip it
+META_FILE = "_oeps_mirror.json"
+# Bump when the columns change; a mirror from another version is ignored until re-exported
+MIRROR_VERSION = 1
+QUESTION_COUNT = 3
+# Files a year may hold before they are merged
+MAX_YEAR_FILES = 32
+ROW_GROUP_SIZE = 16_384
+
+def available():
+    # pyarrow is only needed for the mirror
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+def schema():
+    import pyarrow as pa
+    fields = [
+        ("date", pa.timestamp('us')),
+        ("examiner", pa.string()),
+        ("student", pa.string()),
+        ("total_score", pa.float64()),
+        ("band", pa.string()),
+        ("eap_requirement", pa.string()),
+    ]
+    for i in range(1, QUESTION_COUNT + 1):
+        fields += [(f"q{i}_question", pa.string()), (f"q{i}_score", pa.float64()),
+                   (f"q{i}_notes", pa.list_(pa.string()))]
+    return pa.schema(fields)
+
+def to_table(entries):
+    import pyarrow as pa
+    columns = {name: [] for name in schema().names}
+    for entry in entries:
+        columns["date"].append(OEPS_Storage.entry_date(entry))
+        columns["examiner"].append(entry.get('examiner'))
+        columns["student"].append(entry.get('student'))
+        columns["total_score"].append(entry.get('total score'))
+        columns["band"].append(entry.get('band'))
+        columns["eap_requirement"].append(entry.get('EAP requirement'))
+        questions = entry.get('questions', [])
+        for i in range(QUESTION_COUNT):
+            question = questions[i] if i < len(questions) else {}
+            columns[f"q{i+1}_question"].append(question.get('question'))
+            columns[f"q{i+1}_score"].append(question.get('question score'))
+            columns[f"q{i+1}_notes"].append(question.get('notes'))
+    return pa.table(columns, schema=schema())
+
+def year_dir(directory, year):
+    return os.path.join(directory, f"year={year}")
+
+def _write_file(directory, table):
+    # Names only need to be unique and sortable; writes happen under the store lock
+    import pyarrow.parquet as pq
+    os.makedirs(directory, exist_ok=True)
+    tmp_file = os.path.join(directory, "_writing.parquet")
+    pq.write_table(table, tmp_file, row_group_size=ROW_GROUP_SIZE, compression='zstd')
+    os.replace(tmp_file, os.path.join(directory, f"part-{time.time_ns()}.parquet"))
+
+def load_meta(directory=PARQUET_DIR):
+    # The mirror's metadata, or None if there is no current mirror
+    try:
+        with open(os.path.join(directory, META_FILE), 'r') as file:
+            meta = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return meta if meta.get("version") == MIRROR_VERSION else None
+
+def _save_meta(directory, meta):
+    tmp_file = os.path.join(directory, META_FILE + ".tmp")
+    with open(tmp_file, 'w') as file:
+        json.dump(meta, file)
+    os.replace(tmp_file, os.path.join(directory, META_FILE))
+
+def is_current(directory=PARQUET_DIR):
+    return load_meta(directory) is not None and available()
+
+def export(directory=PARQUET_DIR):
+    # Rebuild the whole mirror from the store
+    with OEPS_Storage.locked():
+        return _export(directory)
+
+def _export(directory):
+    tmp_dir = directory + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    count = 0
+    # The store yields entries in date order, so each year is complete as soon as the next begins
+    years = itertools.groupby(OEPS_Storage.iter_sorted(), key=lambda entry: OEPS_Storage.entry_date(entry).year)
+    for year, entries in years:
+        table = to_table(entries)
+        _write_file(year_dir(tmp_dir, year), table)
+        count += table.num_rows
+    _save_meta(tmp_dir, {"version": MIRROR_VERSION, "exported": datetime.now().isoformat()})
+    old_dir = directory + ".old"
+    if os.path.exists(directory):
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return count
+
+def merge_year(directory):
+    # Replace a year's files with one file in date order
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".parquet")
+                   and not name.startswith("_"))
+    table = pa.concat_tables(pq.read_table(path) for path in paths).sort_by("date")
+    _write_file(directory, table)
+    for path in paths:
+        os.remove(path)
+
+def record_entry(entry, directory=PARQUET_DIR):
+    record_entries([entry], directory)
+
+def record_entries(entries, directory=PARQUET_DIR):
+    # Called by OEPS_Examination.save_entries under the store lock; one new
+    # file per year the entries fall in
+    if load_meta(directory) is None:
+        return
+    if not available():
+        # The mirror can no longer follow the store; drop it rather than serve stale data
+        os.remove(os.path.join(directory, META_FILE))
+        print("pyarrow is not installed; the Parquet mirror is out of date. Run 'python OEPS_Parquet.py export'.")
+        return
+    by_year = {}
+    for entry in entries:
+        by_year.setdefault(OEPS_Storage.entry_date(entry).year, []).append(entry)
+    for year, year_entries in by_year.items():
+        path = year_dir(directory, year)
+        _write_file(path, to_table(year_entries))
+        if len(os.listdir(path)) > MAX_YEAR_FILES:
+            merge_year(path)
+
+def read_table(start_date=None, end_date=None, columns=None, directory=PARQUET_DIR):
+    # Rows with start_date <= date <= end_date; only the years and row groups
+    # that can hold such dates are read
+    import pyarrow.dataset as ds
+    condition = None
+    if start_date is not None:
+        condition = (ds.field("year") >= start_date.year) & (ds.field("date") >= start_date)
+    if end_date is not None:
+        upper = (ds.field("year") <= end_date.year) & (ds.field("date") <= end_date)
+        condition = upper if condition is None else condition & upper
+    # Holding the lock keeps a save from merging a year's files mid-read
+    with OEPS_Storage.locked():
+        dataset = ds.dataset(directory, format="parquet", partitioning="hive")
+        return dataset.to_table(columns=columns, filter=condition)
+
+def read_frame(start_date=None, end_date=None, directory=PARQUET_DIR):
+    # The same (frame, word counts) as OEPS_Aggregation.build_frame over the
+    # entries in the range, in date order
+    import pyarrow.compute as pc
+    import OEPS_Notes
+    score_columns = [f"q{i}_score" for i in range(1, QUESTION_COUNT + 1)]
+    question_columns = [f"q{i}_question" for i in range(1, QUESTION_COUNT + 1)]
+    note_columns = [f"q{i}_notes" for i in range(1, QUESTION_COUNT + 1)]
+    table = read_table(start_date, end_date,
+                       ["date", "examiner", "total_score", "band", "eap_requirement"]
+                       + score_columns + question_columns + note_columns, directory)
+    # Question texts become pandas categoricals
+    for name in question_columns:
+        table = table.set_column(table.schema.get_field_index(name), name, pc.dictionary_encode(table[name]))
+
+    # Each distinct note is counted in Arrow and tokenized once
+    word_counter = OEPS_Notes.new_word_counter()
+    for name in note_columns:
+        for item in pc.value_counts(pc.list_flatten(table[name])).to_pylist():
+            word_counter["pending"][item["values"]] += item["counts"]
+
+    frame = table.drop_columns(note_columns).to_pandas()
+    frame = frame.rename(columns={"total_score": "score", "eap_requirement": "eap",
+                                  **{name: name.split("_")[0] for name in score_columns},
+                                  **{name: "p" + name[1:].split("_")[0] for name in question_columns}})
+    frame = frame.sort_values("date", kind="stable").reset_index(drop=True)
+    return frame, OEPS_Notes.word_frequencies(word_counter)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the Parquet mirror of the OEPS exam data (needs pyarrow).")
+    parser.add_argument("command", choices=["export", "count"],
+                        help="export: rebuild the mirror from the store; count: exams per year in the mirror")
+    parser.add_argument("--dir", default=PARQUET_DIR, help="Mirror directory")
+    args = parser.parse_args()
+
+    if not available():
+        print("The Parquet mirror needs the pyarrow package (pip install pyarrow).")
+        return
+    if args.command == "export":
+        count = export(args.dir)
+        print(f"Wrote {count} entries to {args.dir}/.")
+        return
+    if load_meta(args.dir) is None:
+        print(f"No Parquet mirror in {args.dir}/. Run 'python OEPS_Parquet.py export' first.")
+        return
+    table = read_table(columns=["year"], directory=args.dir)
+    years = table.group_by("year").aggregate([("year", "count")]).sort_by("year")
+    for year, count in zip(years["year"].to_pylist(), years["year_count"].to_pylist()):
+        print(f"{year}: {count}")
+    print(f"{table.num_rows} exams in total.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Opt-in timing hooks for report generation. Code wraps each stage in
+# `with stage(name):`; while no trace is active that costs one check. An
+# active trace records wall time, CPU time and memory per stage and is written
+# out in Chrome trace format (load it in chrome://tracing or Perfetto).
+
+_trace = None
+
+def start_trace(track_memory=False):
+    global _trace
+    _trace = {"events": [], "stack": [], "track_memory": track_memory}
+    if track_memory:
+        tracemalloc.start()
+
+def tracing():
+    return _trace is not None
+
+def _rss_max_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+@contextmanager
+def stage(name, **details):
+    if _trace is None:
+        yield
+        return
+    frame = {"child_peak": 0}
+    _trace["stack"].append(frame)
+    if _trace["track_memory"]:
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        _trace["stack"].pop()
+        args = dict(details, cpu_ms=round(cpu * 1000, 3), rss_max_kb=_rss_max_kb())
+        if _trace["track_memory"]:
+            # reset_peak() is shared by nested stages, so fold each child's
+            # peak back into its parent's
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, frame["child_peak"])
+            args["python_peak_kb"] = peak // 1024
+            args["python_current_kb"] = current // 1024
+            if _trace["stack"]:
+                parent = _trace["stack"][-1]
+                parent["child_peak"] = max(parent["child_peak"], peak)
+            tracemalloc.reset_peak()
+        add_events([{
+            "name": name,
+            "ph": "X",
+            "ts": started * 1e6,
+            "dur": wall * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }])
+
+def add_events(events):
+    # Also used to merge events recorded in worker processes. perf_counter is
+    # a system-wide monotonic clock on Linux, so timestamps line up.
+    if _trace is not None:
+        _trace["events"].extend(events)
+
+def stop_trace(path=None):
+    global _trace
+    trace, _trace = _trace, None
+    if trace is None:
+        return []
+    if trace["track_memory"]:
+        tracemalloc.stop()
+    if path:
+        with open(path, 'w') as file:
+            json.dump({"traceEvents": trace["events"], "displayTimeUnit": "ms"}, file)
+        print(f"Trace written to {path}")
+    return trace["events"]
+
+def add_arguments(parser):
+    parser.add_argument("--trace", metavar="FILE", help="Write per-stage timings as a Chrome trace JSON file")
+    parser.add_argument("--trace-memory", action="store_true", help="Also record Python memory per stage (slow)")
+    parser.add_argument("--profile", metavar="FILE", help="Write a cProfile dump of the whole run (main process only)")
+
+def run(args, func, *func_args, **func_kwargs):
+    # Run func under whatever instrumentation the parsed flags asked for
+    if args.trace or args.trace_memory:
+        start_trace(args.trace_memory)
+    profile = cProfile.Profile() if args.profile else None
+    if profile:
+        profile.enable()
+    try:
+        with stage("run"):
+            return func(*func_args, **func_kwargs)
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(args.profile)
+            print(f"Profile written to {args.profile} (view with python -m pstats {args.profile})")
+        if tracing():
+            events = stop_trace(args.trace)
+            print_summary(events)
+
+def print_summary(events):
+    print(f"{'stage':<48}{'wall ms':>10}{'cpu ms':>10}")
+    for event in sorted(events, key=lambda event: event["ts"]):
+        print(f"{event['name'][:47]:<48}{event['dur'] / 1000:>10.1f}{event['args']['cpu_ms']:>10.1f}")
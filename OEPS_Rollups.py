@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+import OEPS_Storage
+import OEPS_Items
+import OEPS_Notes
+import OEPS_Sketch
+
+# Running totals per calendar quarter, updated as each exam is saved, so the
+# annual and x-year reports can combine a few dozen rollups instead of
+# rescanning every exam
+ROLLUP_FILE = "OEPS_rollups.json"
+# Bump when the rollup contents change meaning (e.g. how note words are
+# counted); stored rollups from another version are rebuilt
+ROLLUP_VERSION = 5
+QUESTION_COUNT = 3
+
+def quarter_label(date):
+    return f"{date.year} Q{(date.month-1)//3 + 1}"
+
+def quarter_start(label):
+    year, quarter = label.split(" Q")
+    return datetime(int(year), (int(quarter) - 1) * 3 + 1, 1)
+
+def next_quarter_start(date):
+    month = ((date.month - 1) // 3) * 3 + 4
+    if month > 12:
+        return datetime(date.year + 1, month - 12, 1)
+    return datetime(date.year, month, 1)
+
+def new_rollup():
+    return {
+        "count": 0,
+        "score_sum": 0.0,
+        "bands": {},
+        "eap": {},
+        "question_sums": [0] * QUESTION_COUNT,
+        "question_counts": [0] * QUESTION_COUNT,
+        # Total score sketches (see OEPS_Sketch) for the quarter and per examiner
+        "scores": OEPS_Sketch.new_sketch(),
+        "examiners": {},
+        "words": {},
+        # Per-prompt sums for item analysis (see OEPS_Items)
+        "items": {},
+    }
+
+def _increment(counts, key):
+    counts[key] = counts.get(key, 0) + 1
+
+def add_counts(target, counts):
+    for key, count in counts.items():
+        target[key] = target.get(key, 0) + count
+
+def add_entry(rollup, entry):
+    score = entry['total score']
+    rollup["count"] += 1
+    rollup["score_sum"] += score
+    _increment(rollup["bands"], entry['band'])
+    _increment(rollup["eap"], entry['EAP requirement'])
+    for i, question in enumerate(entry['questions']):
+        rollup["question_sums"][i] += question['question score']
+        rollup["question_counts"][i] += 1
+        OEPS_Items.add_response(rollup["items"], i + 1, question['question'], question['question score'], score)
+        for note in question['notes']:
+            for word in OEPS_Notes.note_words(note):
+                _increment(rollup["words"], word)
+    OEPS_Sketch.add_value(rollup["scores"], score)
+    OEPS_Sketch.add_value(rollup["examiners"].setdefault(entry['examiner'], OEPS_Sketch.new_sketch()), score)
+
+def _decrement(counts, key):
+    counts[key] -= 1
+    if not counts[key]:
+        del counts[key]
+
+def remove_entry(rollup, entry):
+    # Undo add_entry; keys whose count drops to zero are removed, so the
+    # result matches a rollup that never saw the entry
+    score = entry['total score']
+    rollup["count"] -= 1
+    rollup["score_sum"] = rollup["score_sum"] - score if rollup["count"] else 0.0
+    _decrement(rollup["bands"], entry['band'])
+    _decrement(rollup["eap"], entry['EAP requirement'])
+    for i, question in enumerate(entry['questions']):
+        rollup["question_sums"][i] -= question['question score']
+        rollup["question_counts"][i] -= 1
+        OEPS_Items.remove_response(rollup["items"], i + 1, question['question'], question['question score'], score)
+        for note in question['notes']:
+            for word in OEPS_Notes.note_words(note):
+                _decrement(rollup["words"], word)
+    OEPS_Sketch.remove_value(rollup["scores"], score)
+    sketch = rollup["examiners"][entry['examiner']]
+    OEPS_Sketch.remove_value(sketch, score)
+    if not sketch["count"]:
+        del rollup["examiners"][entry['examiner']]
+
+def merge_rollups(rollups):
+    merged = new_rollup()
+    for rollup in rollups:
+        merged["count"] += rollup["count"]
+        merged["score_sum"] += rollup["score_sum"]
+        add_counts(merged["bands"], rollup["bands"])
+        add_counts(merged["eap"], rollup["eap"])
+        for i in range(QUESTION_COUNT):
+            merged["question_sums"][i] += rollup["question_sums"][i]
+            merged["question_counts"][i] += rollup["question_counts"][i]
+        OEPS_Sketch.merge_sketch(merged["scores"], rollup["scores"])
+        for name, sketch in rollup["examiners"].items():
+            OEPS_Sketch.merge_sketch(merged["examiners"].setdefault(name, OEPS_Sketch.new_sketch()), sketch)
+        add_counts(merged["words"], rollup["words"])
+        OEPS_Items.merge_items(merged["items"], rollup["items"])
+    return merged
+
+def rollup_entries(entries):
+    quarters = {}
+    for entry in entries:
+        label = quarter_label(OEPS_Storage.entry_date(entry))
+        add_entry(quarters.setdefault(label, new_rollup()), entry)
+    return quarters
+
+def load_rollups():
+    try:
+        with open(ROLLUP_FILE, 'r') as file:
+            stored = json.load(file)
+    except FileNotFoundError:
+        return None
+    if stored.get("version") != ROLLUP_VERSION:
+        return None
+    return stored["quarters"]
+
+def save_rollups(quarters):
+    tmp_file = ROLLUP_FILE + ".tmp"
+    with open(tmp_file, 'w') as file:
+        json.dump({"version": ROLLUP_VERSION, "quarters": quarters}, file)
+    os.replace(tmp_file, ROLLUP_FILE)
+
+def rebuild():
+    # Full rescan of the store; run after backfills or if a save was interrupted.
+    # Holds the store lock so no exam is saved between the scan and the write.
+    with OEPS_Storage.locked():
+        quarters = rollup_entries(OEPS_Storage.iter_entries())
+        save_rollups(quarters)
+    return quarters
+
+def record_entry(entry):
+    record_entries([entry])
+
+def record_entries(entries):
+    quarters = load_rollups()
+    if quarters is None:
+        # The first save after an upgrade builds the rollups from scratch,
+        # and that rebuild already includes the entries just appended
+        rebuild()
+        return
+    for entry in entries:
+        label = quarter_label(OEPS_Storage.entry_date(entry))
+        add_entry(quarters.setdefault(label, new_rollup()), entry)
+    save_rollups(quarters)
+
+def load_or_rebuild():
+    quarters = load_rollups()
+    if quarters is None:
+        quarters = rebuild()
+    return quarters
+
+def window_rollups(start_date, end_date, quarters=None):
+    # Rollups by quarter for start_date <= date <= end_date. Quarters wholly
+    # inside the window come from the stored rollups (pass them in to reuse
+    # one load across many windows); the partial quarters at either edge are
+    # rolled up from the raw entries on the fly.
+    if quarters is None:
+        quarters = load_or_rebuild()
+
+    full_start = start_date if start_date == quarter_start(quarter_label(start_date)) else next_quarter_start(start_date)
+    full_end = full_start
+    while next_quarter_start(full_end) <= end_date + timedelta(microseconds=1):
+        full_end = next_quarter_start(full_end)
+
+    if full_end <= full_start:
+        return rollup_entries(OEPS_Storage.iter_range(start_date, end_date))
+
+    window = {label: rollup for label, rollup in quarters.items()
+              if full_start <= quarter_start(label) < full_end}
+    window.update(rollup_entries(OEPS_Storage.iter_range(start_date, full_start - timedelta(microseconds=1))))
+    window.update(rollup_entries(OEPS_Storage.iter_range(full_end, end_date)))
+    return window
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the OEPS quarterly rollups.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    quarters = rebuild()
+    print(f"Rebuilt {len(quarters)} quarterly rollups in {ROLLUP_FILE}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlsplit
+import OEPS_Storage
+import OEPS_Rollups
+import OEPS_Notes
+import OEPS_Examination
+import OEPS_EXT_Reporting
+import OEPS_Index
+
+# Local HTTP service for department staff: placement status and report
+# statistics answered from data kept in memory, exam submissions, and PDF
+# reports rendered by a queue of worker processes. Standard library only.
+#
+#   GET  /status                      service health, report queue, request latencies
+#   GET  /placement[?student=NAME]    EAP placement counts, or one student's latest result
+#   GET  /stats?period=2024           report statistics as JSON (periods as in OEPS_AR)
+#   GET  /search?student=...&note=... exam search (see OEPS_Index.search)
+#   POST /exams                       submit an exam (the create_new_entry schema)
+#   POST /reports?kind=annual&period=2024   queue a PDF (kind=placement needs no period)
+#   GET  /reports/ID                  job status
+#   GET  /reports/ID/pdf              the finished PDF
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8347
+MAX_BODY_BYTES = 1024 * 1024
+PLACEMENT_DAYS = 365
+
+# Response-time targets per route; slower requests are logged and counted
+LATENCY_TARGETS = {
+    "/status": 0.05,
+    "/placement": 0.05,
+    "/search": 0.25,
+    "/stats": 0.5,
+    "/exams": 0.25,
+    "/reports": 0.05,
+}
+LATENCY_SAMPLES = 1000
+
+# Everything the service keeps in memory between requests
+state = {
+    "rollups": None,
+    "rollups_mtime": None,
+    # Each student's latest attempt as (date, student, requirement, total
+    # score), keyed by OEPS_Index.student_key, for students whose latest
+    # attempt falls in the placement window: the rows of the placement report
+    "latest": {},
+    "store_signature": None,
+    "jobs": {},
+    "job_ids": itertools.count(1),
+    "queue": None,
+    "pool": None,
+    "latency": {},
+    "started": None,
+}
+
+def set_latest(attempt):
+    # attempt: a student's latest attempt as OEPS_Index returns it
+    requirement = OEPS_EXT_Reporting.determine_eap_requirement(attempt['total score'])
+    state["latest"][OEPS_Index.student_key(attempt['student'])] = (
+        datetime.fromisoformat(attempt['date']), attempt['student'], requirement, attempt['total score'])
+
+def load_placement():
+    # The same latest attempts OEPS_EXT_Reporting lists, read from the
+    # student index, so a retake replaces the earlier result here too
+    with OEPS_Storage.locked():
+        signature = OEPS_Storage.store_signature()
+        attempts = OEPS_Index.latest_attempts(datetime.now() - timedelta(days=PLACEMENT_DAYS))
+    state["latest"] = {}
+    for attempt in attempts:
+        set_latest(attempt)
+    state["store_signature"] = signature
+
+def refresh_placement():
+    # Reload only if another process (e.g. the TUI) changed the store
+    if OEPS_Storage.store_signature() != state["store_signature"]:
+        load_placement()
+
+def hot_rollups():
+    try:
+        mtime = os.stat(OEPS_Rollups.ROLLUP_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if state["rollups"] is None or mtime != state["rollups_mtime"]:
+        state["rollups"] = OEPS_Rollups.load_or_rebuild()
+        state["rollups_mtime"] = os.stat(OEPS_Rollups.ROLLUP_FILE).st_mtime_ns
+    return state["rollups"]
+
+def json_default(value):
+    # numpy scalars, datetimes and the like
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+def json_response(status, data):
+    return status, "application/json", json.dumps(data, default=json_default).encode('utf-8')
+
+def error_response(status, message):
+    return json_response(status, {"error": message})
+
+def query_value(query, name, required=False):
+    values = query.get(name)
+    if not values:
+        if required:
+            raise ValueError(f"Missing query parameter: {name}")
+        return None
+    return values[0]
+
+def parse_period(text):
+    import OEPS_AR
+    try:
+        return OEPS_AR.parse_period(text)
+    except argparse.ArgumentTypeError as e:
+        raise ValueError(str(e))
+
+def check_period(text):
+    # Syntax only: resolving "last365" refreshes the rolling window, which
+    # takes the store lock, so that is left to the executor or report worker
+    if text != 'last365':
+        parse_period(text)
+
+def build_entry(submission):
+    # Validate a submitted exam by the interactive exam's rules (see
+    # OEPS_Examination.valid_name, valid_question and valid_score) and fill
+    # in the derived fields the way OEPS_Examination.create_new_entry does
+    if not isinstance(submission, dict):
+        raise ValueError("Expected a JSON object.")
+    entry = {}
+    for field in ("examiner", "student"):
+        value = submission.get(field)
+        if not isinstance(value, str) or not OEPS_Examination.valid_name(value.strip()):
+            raise ValueError(f"'{field}' must be a name of at least {OEPS_Examination.MIN_NAME_LENGTH} characters "
+                             f"using letters, spaces, and hyphens only.")
+        entry[field] = value.strip()
+    date = submission.get("date")
+    try:
+        date = datetime.fromisoformat(date) if date else datetime.now()
+    except (TypeError, ValueError):
+        raise ValueError("'date' must be an ISO 8601 timestamp.")
+    # Stored dates are local time; an offset would not compare with them
+    if date.tzinfo is not None:
+        raise ValueError("'date' must be in local time, without a time zone.")
+    entry["date"] = date.isoformat()
+    questions = submission.get("questions")
+    if not isinstance(questions, list) or len(questions) != len(OEPS_Examination.QUESTION_WEIGHTS):
+        raise ValueError(f"'questions' must list {len(OEPS_Examination.QUESTION_WEIGHTS)} questions.")
+    entry["questions"] = []
+    for number, question in enumerate(questions, 1):
+        if not isinstance(question, dict) or not isinstance(question.get("question"), str):
+            raise ValueError(f"Question {number} needs a 'question' text.")
+        text = question["question"].strip()
+        if not OEPS_Examination.valid_question(number, text):
+            raise ValueError(f"Question {number} 'question' must be one of the question bank's prompts for question {number}.")
+        notes = question.get("notes", [])
+        if not isinstance(notes, list) or not all(isinstance(note, str) for note in notes):
+            raise ValueError(f"Question {number} 'notes' must be a list of strings.")
+        score = question.get("question score")
+        if not OEPS_Examination.valid_score(score):
+            raise ValueError(f"Question {number} 'question score' must be a whole number from 0 to {OEPS_Examination.MAX_SCORE}.")
+        entry["questions"].append({"question": text, "notes": notes, "question score": score})
+    entry["total score"] = OEPS_Examination.calculate_total_score(entry["questions"])
+    entry["band"] = OEPS_Examination.determine_band(entry["total score"])
+    entry["EAP requirement"] = OEPS_Examination.get_EAP_requirement(entry["total score"])
+    return entry
+
+def save_submission(entry):
+    # Runs in a thread; the store lock also covers updating the in-memory
+    # placement rows, so a save by another process cannot slip in between
+    with OEPS_Storage.locked():
+        refresh_placement()
+        OEPS_Examination.save_data(entry)
+        # The index decides whether the exam is now the student's latest
+        set_latest(OEPS_Index.current_status(entry['student']))
+        state["store_signature"] = OEPS_Storage.store_signature()
+
+def latency_summary():
+    summary = {}
+    for route, samples in state["latency"].items():
+        ordered = sorted(samples)
+        target = LATENCY_TARGETS.get(route)
+        summary[route] = {
+            "requests": len(ordered),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+            "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2),
+            "target_ms": target * 1000 if target else None,
+            "over_target": sum(1 for seconds in ordered if target and seconds > target),
+        }
+    return summary
+
+async def handle_status(query, body):
+    jobs = state["jobs"].values()
+    return json_response(200, {
+        "uptime_seconds": round(time.monotonic() - state["started"], 1),
+        "placement_students": len(state["latest"]),
+        "reports": dict(Counter(job["status"] for job in jobs)),
+        "report_queue_length": state["queue"].qsize(),
+        "latency": latency_summary(),
+    })
+
+async def handle_placement(query, body):
+    if OEPS_Storage.store_signature() != state["store_signature"]:
+        # Another process saved; reload off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, refresh_placement)
+    cutoff = datetime.now() - timedelta(days=PLACEMENT_DAYS)
+    student = query_value(query, "student")
+    if student:
+        row = state["latest"].get(OEPS_Index.student_key(student))
+        if row is None or row[0] < cutoff:
+            return error_response(404, f"No exam for {student} in the last {PLACEMENT_DAYS} days.")
+        date, name, requirement, total_score = row
+        return json_response(200, {"student": name, "date": date, "total score": total_score,
+                                    "EAP requirement": requirement})
+    rows = [row for row in state["latest"].values() if row[0] >= cutoff]
+    counts = Counter(row[2] for row in rows)
+    return json_response(200, {
+        "since": cutoff,
+        "students": len(rows),
+        "counts": {requirement: counts.get(requirement, 0) for requirement in OEPS_EXT_Reporting.REQUIREMENTS},
+    })
+
+def report_stats_json(period):
+    import OEPS_AR
+    start_date, end_date = parse_period(period)
+    stats = OEPS_AR.compute_report_stats(start_date, end_date, rollups=hot_rollups())
+    if stats is None:
+        return None
+    result = {key: value for key, value in stats.items() if key not in ("quarterly_avg", "word_counts", "examiner_quarters")}
+    result["quarterly_avg"] = [[date.date(), None if value != value else value]
+                               for date, value in stats["quarterly_avg"].items()]
+    result["common_words"] = OEPS_Notes.top_words(stats["word_counts"], 20)
+    return dict(result, start=start_date, end=end_date)
+
+async def handle_stats(query, body):
+    period = query_value(query, "period", required=True)
+    check_period(period)
+    # The period and edge quarters are read from disk, so keep it off the event loop
+    stats = await asyncio.get_running_loop().run_in_executor(None, report_stats_json, period)
+    if stats is None:
+        return error_response(404, "No data available for the selected period.")
+    return json_response(200, stats)
+
+def run_search(filters):
+    return OEPS_Index.search(**filters)
+
+async def handle_search(query, body):
+    filters = {name: query_value(query, name) for name in ("note", "student", "examiner", "question")}
+    filters = {name: value for name, value in filters.items() if value}
+    if not filters:
+        raise ValueError("Give at least one of note, student, examiner or question.")
+    number = query_value(query, "question_number")
+    filters["question_number"] = int(number) if number else None
+    filters["limit"] = int(query_value(query, "limit") or 100)
+    results = await asyncio.get_running_loop().run_in_executor(None, run_search, filters)
+    return json_response(200, {"results": results})
+
+async def handle_submit_exam(query, body):
+    try:
+        submission = json.loads(body)
+    except json.JSONDecodeError:
+        raise ValueError("Body must be JSON.")
+    entry = build_entry(submission)
+    await asyncio.get_running_loop().run_in_executor(None, save_submission, entry)
+    return json_response(201, entry)
+
+def render_report(kind, period):
+    # Runs in a worker process
+    if kind == "placement":
+        return OEPS_EXT_Reporting.generate_report('pdf')
+    import OEPS_AR
+    start_date, end_date = OEPS_AR.parse_period(period)
+    return OEPS_AR.create_report(start_date, end_date, workers=1)
+
+async def handle_queue_report(query, body):
+    kind = query_value(query, "kind") or "annual"
+    if kind not in ("annual", "placement"):
+        raise ValueError("kind must be annual or placement.")
+    period = None
+    if kind == "annual":
+        period = query_value(query, "period", required=True)
+        check_period(period)
+    # A report already waiting or rendering is shared rather than queued twice
+    for job in state["jobs"].values():
+        if job["kind"] == kind and job["period"] == period and job["status"] in ("queued", "running"):
+            return json_response(202, job)
+    job = {"id": next(state["job_ids"]), "kind": kind, "period": period, "status": "queued",
+           "file": None, "error": None, "queued_at": datetime.now(), "finished_at": None}
+    state["jobs"][job["id"]] = job
+    await state["queue"].put(job)
+    return json_response(202, job)
+
+async def handle_report(job_id, want_pdf):
+    job = state["jobs"].get(job_id)
+    if job is None:
+        return error_response(404, f"No report job {job_id}.")
+    if not want_pdf:
+        return json_response(200, job)
+    if job["status"] != "done":
+        return error_response(409, f"Report job {job_id} is {job['status']}.")
+    with open(job["file"], 'rb') as file:
+        return 200, "application/pdf", file.read()
+
+async def report_worker():
+    # Takes jobs off the queue one at a time and renders them in the process
+    # pool, so rendering never blocks request handling
+    loop = asyncio.get_running_loop()
+    while True:
+        job = await state["queue"].get()
+        job["status"] = "running"
+        try:
+            output = await loop.run_in_executor(state["pool"], render_report, job["kind"], job["period"])
+            if output is None:
+                job["status"], job["error"] = "failed", "No data available for the selected period."
+            else:
+                job["status"], job["file"] = "done", output
+        except Exception as e:
+            job["status"], job["error"] = "failed", str(e)
+        job["finished_at"] = datetime.now()
+        state["queue"].task_done()
+
+ROUTES = {
+    ("GET", "/status"): handle_status,
+    ("GET", "/placement"): handle_placement,
+    ("GET", "/stats"): handle_stats,
+    ("GET", "/search"): handle_search,
+    ("POST", "/exams"): handle_submit_exam,
+    ("POST", "/reports"): handle_queue_report,
+}
+
+async def dispatch(method, path, query, body):
+    handler = ROUTES.get((method, path))
+    if handler:
+        return path, await handler(query, body)
+    parts = path.strip('/').split('/')
+    if method == "GET" and parts[0] == "reports" and len(parts) in (2, 3) and parts[1].isdigit():
+        if len(parts) == 3 and parts[2] != "pdf":
+            return "/reports", error_response(404, "Not found.")
+        return "/reports", await handle_report(int(parts[1]), len(parts) == 3)
+    return None, error_response(404, "Not found.")
+
+async def read_request(reader):
+    request_line = (await reader.readline()).decode('latin-1')
+    method, target, _ = request_line.split(' ', 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1')
+        if line in ('\r\n', '\n', ''):
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError("Request body too large.")
+    body = await reader.readexactly(length) if length else b''
+    return method, target, body
+
+async def handle_connection(reader, writer):
+    started = time.perf_counter()
+    route = None
+    try:
+        try:
+            method, target, body = await read_request(reader)
+        except (ValueError, UnicodeDecodeError, asyncio.IncompleteReadError):
+            response = error_response(400, "Malformed request.")
+        else:
+            url = urlsplit(target)
+            try:
+                route, response = await dispatch(method, url.path, parse_qs(url.query), body)
+            except ValueError as e:
+                response = error_response(400, str(e))
+            except Exception as e:
+                response = error_response(500, f"{type(e).__name__}: {e}")
+        status, content_type, payload = response
+        elapsed = time.perf_counter() - started
+        writer.write((f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                      f"Content-Type: {content_type}\r\n"
+                      f"Content-Length: {len(payload)}\r\n"
+                      f"X-Response-Time-Ms: {elapsed * 1000:.2f}\r\n"
+                      "Connection: close\r\n\r\n").encode('latin-1') + payload)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+    if route:
+        elapsed = time.perf_counter() - started
+        state["latency"].setdefault(route, deque(maxlen=LATENCY_SAMPLES)).append(elapsed)
+        target = LATENCY_TARGETS.get(route)
+        if target and elapsed > target:
+            print(f"[latency] {route} took {elapsed * 1000:.1f} ms (target {target * 1000:.0f} ms)")
+
+STATUS_TEXT = {200: "OK", 201: "Created", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+               409: "Conflict", 500: "Internal Server Error"}
+
+def warm_up():
+    # Load the data and the reporting libraries, and build any missing
+    # rollups or search index, before the first request
+    import OEPS_AR
+    import OEPS_Aggregation
+    load_placement()
+    hot_rollups()
+    OEPS_Index.open_or_rebuild().close()
+
+async def serve(host, port, workers):
+    state["started"] = time.monotonic()
+    state["queue"] = asyncio.Queue()
+    state["pool"] = ProcessPoolExecutor(max_workers=workers)
+    await asyncio.get_running_loop().run_in_executor(None, warm_up)
+    report_workers = [asyncio.create_task(report_worker()) for _ in range(workers)]
+    server = await asyncio.start_server(handle_connection, host, port)
+    print(f"OEPS service listening on http://{host}:{port} with {workers} report worker(s).")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in report_workers:
+            task.cancel()
+        state["pool"].shutdown(cancel_futures=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve OEPS placement status, statistics, exam capture and reports over HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to listen on (default: local only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 2) - 1, 1),
+                        help="Worker processes rendering PDF reports")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        print("Service stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Mergeable summaries of a score distribution in bounded memory. A sketch is a
+# count, a sum and a histogram of values rounded to RESOLUTION. Total scores
+# are weighted sums of 0-3 marks rounded to two decimals, so the histogram
+# holds at most a few hundred bins however many exams it covers, and its
+# quantiles are exactly those of the raw scores. Sketches are plain dicts so
+# they can be stored in the quarterly rollups and merged by adding bins.
+#
+# Adding and merging are plain Python; numpy is imported only by the
+# functions that summarize a sketch, so saving an exam (which updates the
+# rollups) does not load it.
+
+RESOLUTION = 0.01
+# Whisker reach in IQRs, as matplotlib's boxplot uses by default
+WHISKER_IQR = 1.5
+
+def bin_key(value):
+    return f"{round(value / RESOLUTION) * RESOLUTION:.2f}"
+
+def new_sketch():
+    return {"count": 0, "sum": 0.0, "bins": {}}
+
+def add_value(sketch, value):
+    key = bin_key(value)
+    sketch["count"] += 1
+    sketch["sum"] += value
+    sketch["bins"][key] = sketch["bins"].get(key, 0) + 1
+
+def remove_value(sketch, value):
+    # Undo add_value, e.g. when an exam leaves a rolling window
+    key = bin_key(value)
+    sketch["count"] -= 1
+    sketch["sum"] = sketch["sum"] - value if sketch["count"] else 0.0
+    sketch["bins"][key] -= 1
+    if not sketch["bins"][key]:
+        del sketch["bins"][key]
+
+def merge_sketch(target, other):
+    target["count"] += other["count"]
+    target["sum"] += other["sum"]
+    for key, count in other["bins"].items():
+        target["bins"][key] = target["bins"].get(key, 0) + count
+    return target
+
+def from_values(values):
+    # Sketch of a whole array at once
+    import numpy as np
+    values = np.asarray(values, dtype=float)
+    keys, counts = np.unique(np.round(values / RESOLUTION).astype(np.int64), return_counts=True)
+    return {
+        "count": int(values.size),
+        "sum": float(values.sum()),
+        "bins": {f"{key * RESOLUTION:.2f}": int(count) for key, count in zip(keys, counts)},
+    }
+
+def distribution(sketch):
+    # Distinct values in ascending order with their counts
+    import numpy as np
+    values = np.array([float(key) for key in sketch["bins"]])
+    counts = np.array(list(sketch["bins"].values()), dtype=np.int64)
+    order = np.argsort(values)
+    return values[order], counts[order]
+
+def quantiles(values, counts, qs):
+    # Same as np.percentile(..., method='linear') on the expanded data
+    import numpy as np
+    cumulative = np.cumsum(counts)
+    positions = np.asarray(qs, dtype=float) * (cumulative[-1] - 1)
+    lower = values[np.searchsorted(cumulative, np.floor(positions), side='right')]
+    upper = values[np.searchsorted(cumulative, np.ceil(positions), side='right')]
+    return lower + (upper - lower) * (positions - np.floor(positions))
+
+def box_stats(values, counts):
+    # The statistics matplotlib's Axes.bxp draws, computed the way
+    # cbook.boxplot_stats does, plus count and mean. Fliers are listed once
+    # per distinct value.
+    import numpy as np
+    q1, median, q3 = quantiles(values, counts, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    inside_high = values[values <= q3 + WHISKER_IQR * iqr]
+    inside_low = values[values >= q1 - WHISKER_IQR * iqr]
+    whishi = inside_high.max() if inside_high.size and inside_high.max() > q3 else q3
+    whislo = inside_low.min() if inside_low.size and inside_low.min() < q1 else q1
+    fliers = values[(values < whislo) | (values > whishi)]
+    count = int(counts.sum())
+    return {
+        "count": count,
+        "mean": float((values * counts).sum() / count),
+        "med": float(median),
+        "q1": float(q1),
+        "q3": float(q3),
+        "whislo": float(whislo),
+        "whishi": float(whishi),
+        "fliers": [float(value) for value in fliers],
+    }
+
+def sketch_box_stats(sketch):
+    stats = box_stats(*distribution(sketch))
+    # The stored sum is exact; the binned one is rounded
+    stats["mean"] = sketch["sum"] / sketch["count"]
+    return stats
+
+def exact_box_stats(values):
+    # Same statistics from the raw values, without rounding to RESOLUTION
+    import numpy as np
+    values, counts = np.unique(np.asarray(values, dtype=float), return_counts=True)
+    return box_stats(values, counts)
+
+def sketch_quantile(sketch, q):
+    return float(quantiles(*distribution(sketch), [q])[0])
+
+def sketch_min(sketch):
+    return min(map(float, sketch["bins"]))
+
+def sketch_max(sketch):
+    return max(map(float, sketch["bins"]))
@@ -0,0 +1,374 @@
+import argparse
+import heapq
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Legacy storage: one JSON array rewritten in full on every save
+DATA_FILE = "OEPS_data.json"
+
+# Current storage: a compacted snapshot (one entry per line, sorted by date)
+# plus an append-only journal of exams saved since the last compaction
+SNAPSHOT_FILE = "OEPS_data.jsonl"
+JOURNAL_FILE = "OEPS_journal.jsonl"
+COMPACTING_FILE = JOURNAL_FILE + ".compacting"
+
+# Fold the journal into the snapshot once it grows past this size
+COMPACT_THRESHOLD_BYTES = 4 * 1024 * 1024
+
+# Read size used when streaming the legacy JSON array
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Held by any process changing the store or the files derived from it (the
+# rollups and the search index), so concurrent examiner sessions never
+# interleave a save with another save or a compaction
+LOCK_FILE = "OEPS_data.lock"
+
+# The lock is re-entrant within a process (save_data holds it around
+# append_entry, which takes it again) and shared by its threads
+_thread_lock = threading.RLock()
+_lock = {"file": None, "depth": 0}
+
+def _acquire(file):
+    if fcntl:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        return
+    file.seek(0)
+    while True:
+        try:
+            # Retries for about 10 seconds before raising
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+def _release(file):
+    if fcntl:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        return
+    file.seek(0)
+    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def locked():
+    with _thread_lock:
+        if _lock["depth"] == 0:
+            file = open(LOCK_FILE, 'a+b')
+            try:
+                _acquire(file)
+            except BaseException:
+                file.close()
+                raise
+            _lock["file"] = file
+        _lock["depth"] += 1
+        try:
+            yield
+        finally:
+            _lock["depth"] -= 1
+            if _lock["depth"] == 0:
+                file, _lock["file"] = _lock["file"], None
+                _release(file)
+                file.close()
+
+def entry_date(entry):
+    return datetime.fromisoformat(entry['date'])
+
+def entry_key(entry):
+    # Exams carry no id; the timestamp (to the microsecond) plus the names
+    # is unique in practice and is only used to de-duplicate after a crash
+    return (entry['date'], entry['examiner'], entry['student'])
+
+def _fsync_write(file, text):
+    file.write(text)
+    file.flush()
+    os.fsync(file.fileno())
+
+def _open(path, mode='r'):
+    try:
+        return open(path, mode)
+    except FileNotFoundError:
+        return None
+
+def _open_store(snapshot_mode='r'):
+    # Open the compacting file, snapshot and journal together under the lock,
+    # so a compaction running alongside a long read cannot move entries from
+    # a file not yet opened into one already read
+    with locked():
+        return _open(COMPACTING_FILE), _open(SNAPSHOT_FILE, snapshot_mode), _open(JOURNAL_FILE)
+
+def _read_lines(path, raw=False):
+    return _read_file(_open(path), path, raw)
+
+def _read_file(file, path, raw=False):
+    # Entries, or (entry, line) pairs with raw=True
+    if file is None:
+        return
+    with file:
+        for line_number, line in enumerate(file, 1):
+            if not line.endswith("\n"):
+                # Torn final write from an interrupted save; never committed
+                break
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping unreadable record on line {line_number} of {path}.")
+                continue
+            yield (entry, line) if raw else entry
+
+def _iter_json_array(path):
+    # Yield the items of a top-level JSON array without loading the whole file
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as file:
+        buffer = file.read(READ_CHUNK_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} does not contain a JSON array.")
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+
+def _write_snapshot(lines):
+    # lines must already be in date order; written to a temp file and swapped in
+    count = 0
+    tmp_file = SNAPSHOT_FILE + ".tmp"
+    with open(tmp_file, 'wb') as file:
+        for line in lines:
+            file.write(line)
+            count += 1
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_file, SNAPSHOT_FILE)
+    return count
+
+def _encode(entry):
+    return (json.dumps(entry) + "\n").encode('utf-8')
+
+def migrate():
+    # One-time conversion of the legacy JSON array into the snapshot.
+    # The legacy file is left in place untouched as a backup.
+    if os.path.exists(SNAPSHOT_FILE) or not os.path.exists(DATA_FILE):
+        return 0
+    with locked():
+        # Another process may have migrated while this one waited
+        if os.path.exists(SNAPSHOT_FILE):
+            return 0
+        return _migrate()
+
+def _migrate():
+    # Stream the array out unsorted, keeping only (date, offset, length) per
+    # entry in memory, then copy the lines across in date order
+    unsorted_file = SNAPSHOT_FILE + ".unsorted"
+    positions = []
+    with open(unsorted_file, 'wb') as file:
+        for entry in _iter_json_array(DATA_FILE):
+            line = _encode(entry)
+            positions.append((entry_date(entry), file.tell(), len(line)))
+            file.write(line)
+    positions.sort()
+    with open(unsorted_file, 'rb') as file:
+        def sorted_lines():
+            for _, offset, length in positions:
+                file.seek(offset)
+                yield file.read(length)
+        count = _write_snapshot(sorted_lines())
+    os.remove(unsorted_file)
+    return count
+
+def store_signature():
+    # (modification time, size) of each store file; changes whenever any
+    # process saves or compacts
+    signature = []
+    for path in (SNAPSHOT_FILE, JOURNAL_FILE, COMPACTING_FILE):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def project(entry, fields=None, notes=True):
+    # Keep only the given top-level fields and optionally drop the notes
+    # arrays, which make up most of each record
+    if fields is not None:
+        entry = {key: entry[key] for key in fields if key in entry}
+    if not notes and 'questions' in entry:
+        entry['questions'] = [{key: value for key, value in question.items() if key != 'notes'}
+                              for question in entry['questions']]
+    return entry
+
+def _iter_all():
+    migrate()
+    compacting, snapshot, journal = _open_store()
+    # An interrupted compaction may already have copied these entries into
+    # the snapshot, so prefer the copies in the compacting file
+    pending = list(_read_file(compacting, COMPACTING_FILE))
+    pending_keys = {entry_key(entry) for entry in pending}
+    for entry in _read_file(snapshot, SNAPSHOT_FILE):
+        if entry_key(entry) not in pending_keys:
+            yield entry
+    yield from pending
+    yield from _read_file(journal, JOURNAL_FILE)
+
+def iter_entries(fields=None, notes=True):
+    # Stream every entry one at a time; memory stays bounded by one record
+    for entry in _iter_all():
+        yield project(entry, fields, notes)
+
+def load_data():
+    return list(iter_entries())
+
+def iter_sorted(fields=None, notes=True):
+    # Every entry in date order without compacting: the sorted snapshot
+    # merged with the (small) journal, sorted in memory
+    migrate()
+    compacting, snapshot, journal = _open_store()
+    pending = list(_read_file(compacting, COMPACTING_FILE))
+    pending_keys = {entry_key(entry) for entry in pending}
+    recent = sorted(pending + list(_read_file(journal, JOURNAL_FILE)), key=entry_date)
+    existing = (entry for entry in _read_file(snapshot, SNAPSHOT_FILE) if entry_key(entry) not in pending_keys)
+    for entry in heapq.merge(existing, recent, key=entry_date):
+        yield project(entry, fields, notes)
+
+def _seek_date(file, size, start_date):
+    # Binary search the date-sorted snapshot for the first line dated on or
+    # after start_date, parsing only the O(log n) lines it probes
+    def next_line_start(position):
+        if position == 0:
+            file.seek(0)
+        else:
+            file.seek(position - 1)
+            file.readline()
+        return file.tell()
+
+    def at_or_after(position):
+        line_start = next_line_start(position)
+        if line_start >= size:
+            return True
+        return entry_date(json.loads(file.readline())) >= start_date
+
+    low, high = 0, size
+    while low < high:
+        middle = (low + high) // 2
+        if at_or_after(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return next_line_start(low)
+
+def _read_snapshot_range(file, start_date, end_date):
+    if file is None:
+        return
+    with file:
+        size = os.fstat(file.fileno()).st_size
+        file.seek(_seek_date(file, size, start_date))
+        for line in file:
+            entry = json.loads(line)
+            if entry_date(entry) > end_date:
+                break
+            yield entry
+
+def iter_range(start_date, end_date, fields=None, notes=True):
+    # Stream entries with start_date <= date <= end_date. The snapshot is read
+    # only from the start of the window; the (small) journal is scanned in full.
+    migrate()
+    compacting, snapshot, journal = _open_store('rb')
+    in_range = lambda entry: start_date <= entry_date(entry) <= end_date
+    pending = [entry for entry in _read_file(compacting, COMPACTING_FILE) if in_range(entry)]
+    pending_keys = {entry_key(entry) for entry in pending}
+    for entry in _read_snapshot_range(snapshot, start_date, end_date):
+        if entry_key(entry) not in pending_keys:
+            yield project(entry, fields, notes)
+    for entry in pending:
+        yield project(entry, fields, notes)
+    for entry in _read_file(journal, JOURNAL_FILE):
+        if in_range(entry):
+            yield project(entry, fields, notes)
+
+def query_range(start_date, end_date):
+    return list(iter_range(start_date, end_date))
+
+def append_entry(entry):
+    append_entries([entry])
+
+def append_entries(entries, compact_threshold=COMPACT_THRESHOLD_BYTES):
+    # Any number of exams in one journal write and one fsync. Bulk imports
+    # pass a larger compact_threshold so the snapshot is not rewritten after
+    # every batch.
+    migrate()
+    text = "".join(json.dumps(entry) + "\n" for entry in entries)
+    with locked():
+        with open(JOURNAL_FILE, 'a+b') as file:
+            file.seek(0, os.SEEK_END)
+            if file.tell() > 0:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    # Terminate a torn record so it cannot swallow this one
+                    text = "\n" + text
+            _fsync_write(file, text.encode('utf-8'))
+        compact_if_needed(compact_threshold)
+
+def compact_if_needed(threshold=COMPACT_THRESHOLD_BYTES):
+    with locked():
+        if os.path.exists(JOURNAL_FILE) and os.path.getsize(JOURNAL_FILE) >= threshold:
+            compact()
+
+def compact():
+    migrate()
+    with locked():
+        return _compact()
+
+def _compact():
+    # Move the journal aside first so new exams keep appending to a fresh one
+    if os.path.exists(JOURNAL_FILE) and not os.path.exists(COMPACTING_FILE):
+        os.replace(JOURNAL_FILE, COMPACTING_FILE)
+    if not os.path.exists(COMPACTING_FILE):
+        return 0
+    # Merge the sorted journal entries into the already sorted snapshot in a
+    # single streaming pass. Copies left in the snapshot by an interrupted
+    # compaction are dropped in favour of the journal's.
+    # Snapshot lines are copied through as read rather than re-encoded.
+    pending = sorted(_read_lines(COMPACTING_FILE, raw=True), key=lambda record: entry_date(record[0]))
+    pending_keys = {entry_key(entry) for entry, _ in pending}
+    existing = (record for record in _read_lines(SNAPSHOT_FILE, raw=True) if entry_key(record[0]) not in pending_keys)
+    merged = heapq.merge(existing, pending, key=lambda record: entry_date(record[0]))
+    _write_snapshot(line.encode('utf-8') for _, line in merged)
+    os.remove(COMPACTING_FILE)
+    return len(pending)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the OEPS exam data store.")
+    parser.add_argument("command", choices=["migrate", "compact"])
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = migrate()
+        if count:
+            print(f"Migrated {count} entries from {DATA_FILE} to {SNAPSHOT_FILE}.")
+        else:
+            print("Nothing to migrate.")
+    elif args.command == "compact":
+        count = compact()
+        print(f"Compacted {count} journal entries into {SNAPSHOT_FILE}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+import OEPS_Storage
+from OEPS_Examination import QUESTIONS_BANK, calculate_total_score, determine_band, get_EAP_requirement
+
+# Synthetic exam records matching the OEPS_data.json entry schema, for
+# benchmarking at sizes far beyond the bundled data
+
+EXAMINERS = ["Jay", "Sarah", "Dmitri", "Natalia D.", "Kasumi", "Jim"]
+
+FIRST_NAMES = [
+    "Alex", "Avery", "Cameron", "Casey", "Drew", "Jordan", "Morgan", "Riley", "Skyler", "Taylor",
+    "Jamie", "Quinn", "Reese", "Rowan", "Sage", "Emerson", "Finley", "Harper", "Hayden", "Kai",
+]
+
+LAST_NAMES = [
+    "Smith", "Garcia", "Chen", "Nguyen", "Patel", "Kim", "Lopez", "Okafor", "Rossi", "Silva",
+    "Novak", "Haddad", "Ivanov", "Sato", "Mensah", "Larsen", "Murphy", "Cohen", "Ali", "Park",
+]
+
+NOTE_PHRASES = [
+    "Displayed strong knowledge of the subject.",
+    "Great use of visual aids.",
+    "The presentation lacked some details.",
+    "Struggled to keep within the time limit.",
+    "Good interaction with the audience.",
+    "The mini-lesson was engaging and informative.",
+    "The introduction was clear and well-organized.",
+    "The explanation was concise and easy to understand.",
+    "The speech was too fast and hard to follow.",
+    "The answers to questions were thorough.",
+]
+
+def student_name(rng, student_count):
+    # Distinct names drawn from a pool of student_count; a hyphenated second
+    # surname extends the pool beyond the first x last combinations
+    index = rng.randrange(student_count)
+    first = FIRST_NAMES[index % len(FIRST_NAMES)]
+    index //= len(FIRST_NAMES)
+    last = LAST_NAMES[index % len(LAST_NAMES)]
+    index //= len(LAST_NAMES)
+    while index:
+        last += "-" + LAST_NAMES[index % len(LAST_NAMES)]
+        index //= len(LAST_NAMES)
+    return f"{first} {last}"
+
+def generate_entry(rng, date, student_count):
+    questions = []
+    for num in range(1, 4):
+        questions.append({
+            "question": rng.choice(QUESTIONS_BANK[num]),
+            "notes": rng.sample(NOTE_PHRASES, rng.randint(0, 5)),
+            "question score": rng.randint(0, 3),
+        })
+    total_score = calculate_total_score(questions)
+    return {
+        "examiner": rng.choice(EXAMINERS),
+        "student": student_name(rng, student_count),
+        "date": date.isoformat(),
+        "questions": questions,
+        "total score": total_score,
+        "band": determine_band(total_score),
+        "EAP requirement": get_EAP_requirement(total_score),
+    }
+
+def generate_entries(count, start_date=None, end_date=None, seed=0, student_count=None):
+    # Entries spread evenly over [start_date, end_date] and yielded in date
+    # order, so they can be written straight to a sorted snapshot
+    rng = random.Random(seed)
+    end_date = end_date or datetime.now()
+    start_date = start_date or end_date - timedelta(days=3650)
+    student_count = student_count or max(count // 3, 1)
+    step = (end_date - start_date) / max(count, 1)
+    jitter = max(step // timedelta(microseconds=1), 1)
+    for i in range(count):
+        date = start_date + step * i + timedelta(microseconds=rng.randrange(jitter))
+        yield generate_entry(rng, date, student_count)
+
+def write_jsonl(path, entries):
+    count = 0
+    with open(path, 'w') as file:
+        for entry in entries:
+            file.write(json.dumps(entry) + "\n")
+            count += 1
+    return count
+
+def write_json_array(path, entries):
+    # Same layout as the legacy OEPS_data.json, written without holding the array
+    count = 0
+    with open(path, 'w') as file:
+        file.write("[")
+        for entry in entries:
+            file.write(("," if count else "") + "\n" + json.dumps(entry, indent=2))
+            count += 1
+        file.write("\n]")
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic OEPS exam data.")
+    parser.add_argument("count", type=int, help="Number of exam entries")
+    parser.add_argument("--output", default="OEPS_synthetic.jsonl", help="Output file")
+    parser.add_argument("--format", choices=["jsonl", "json"], default="jsonl",
+                        help="jsonl writes a sorted snapshot; json writes the legacy array")
+    parser.add_argument("--years", type=int, default=10, help="Years of history ending today")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="Overwrite an existing exam store")
+    args = parser.parse_args()
+
+    # Writing over the live store would replace every recorded exam
+    store_files = (OEPS_Storage.DATA_FILE, OEPS_Storage.SNAPSHOT_FILE, OEPS_Storage.JOURNAL_FILE)
+    if os.path.exists(args.output) and os.path.basename(args.output) in store_files and not args.force:
+        print(f"{args.output} is an existing exam store. Choose another --output or add --force to overwrite it.")
+        return
+
+    end_date = datetime.now()
+    entries = generate_entries(args.count, end_date - timedelta(days=365 * args.years), end_date, args.seed)
+    writer = write_jsonl if args.format == "jsonl" else write_json_array
+    count = writer(args.output, entries)
+    print(f"Wrote {count} synthetic entries to {args.output}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+import OEPS_Storage
+import OEPS_Rollups
+
+# The rolling 365-day window behind the daily "last 365 days" annual report,
+# kept as state instead of being recomputed from a year of exams every day.
+# The state is the quarterly rollups (see OEPS_Rollups) of the exams dated
+# within the window's start and end. A save appends its exams to a log
+# instead of rewriting the window; a refresh folds the log in, moves the
+# window forward and removes only the exams that have aged out, reading
+# just those (and the ones dated since the old end) back from the store.
+# The placement list reads each student's latest attempt from OEPS_Index
+# instead.
+
+WINDOW_FILE = "OEPS_window.json"
+# Exams saved since the window file was written, one per line after a header
+# line naming the window they belong to
+WINDOW_LOG_FILE = "OEPS_window_log.jsonl"
+# Bump when the state changes meaning; a window from another version is rebuilt
+WINDOW_VERSION = 5
+WINDOW_DAYS = 365
+
+def new_window(start, end):
+    return {"version": WINDOW_VERSION, "start": start.isoformat(), "end": end.isoformat(),
+            "quarters": {}}
+
+def log_header(window):
+    return {"version": window["version"], "start": window["start"], "end": window["end"]}
+
+def _read_log():
+    # (header, entries), or (None, None) without a readable log
+    try:
+        with open(WINDOW_LOG_FILE, 'r') as file:
+            lines = file.read().splitlines()
+    except FileNotFoundError:
+        return None, None
+    try:
+        return json.loads(lines[0]), [json.loads(line) for line in lines[1:] if line]
+    except (IndexError, json.JSONDecodeError):
+        # A save interrupted mid-write
+        return None, None
+
+def load_window():
+    # The window file plus the exams logged since it was written, or None
+    # if there is no current window
+    with OEPS_Storage.locked():
+        try:
+            with open(WINDOW_FILE, 'r') as file:
+                window = json.load(file)
+        except FileNotFoundError:
+            return None
+        header, entries = _read_log()
+    if window.get("version") != WINDOW_VERSION or header != log_header(window):
+        # From an older version, or the log belongs to another window (a
+        # refresh was interrupted between the two files)
+        return None
+    for entry in entries:
+        add_entry(window, entry)
+    return window
+
+def save_window(window):
+    # Writes the window with the log folded in, then starts an empty log for it
+    with OEPS_Storage.locked():
+        for path, text in ((WINDOW_FILE, json.dumps(window)), (WINDOW_LOG_FILE, json.dumps(log_header(window)) + "\n")):
+            tmp_file = path + ".tmp"
+            with open(tmp_file, 'w') as file:
+                file.write(text)
+            os.replace(tmp_file, path)
+
+def period(window):
+    return datetime.fromisoformat(window["start"]), datetime.fromisoformat(window["end"])
+
+def add_entry(window, entry):
+    label = OEPS_Rollups.quarter_label(OEPS_Storage.entry_date(entry))
+    OEPS_Rollups.add_entry(window["quarters"].setdefault(label, OEPS_Rollups.new_rollup()), entry)
+
+def remove_entry(window, entry):
+    label = OEPS_Rollups.quarter_label(OEPS_Storage.entry_date(entry))
+    OEPS_Rollups.remove_entry(window["quarters"][label], entry)
+    if not window["quarters"][label]["count"]:
+        del window["quarters"][label]
+
+def build(start, end):
+    # Full scan of the exams dated from start to end
+    window = new_window(start, end)
+    for entry in OEPS_Storage.iter_range(start, end):
+        add_entry(window, entry)
+    return window
+
+def expire(window, start):
+    # Remove the exams dated before start. Returns False if the store no
+    # longer holds exactly the exams the window counted (e.g. the data was
+    # replaced), in which case the window must be rebuilt.
+    try:
+        for entry in OEPS_Storage.iter_range(datetime.fromisoformat(window["start"]), start - timedelta(microseconds=1)):
+            remove_entry(window, entry)
+    except KeyError:
+        return False
+    window["start"] = start.isoformat()
+    # Quarters that ended before the new start must have emptied; exams left
+    # in them were counted by the window but are no longer in the store
+    return not any(OEPS_Rollups.next_quarter_start(OEPS_Rollups.quarter_start(label)) <= start
+                   for label in window["quarters"])
+
+def extend(window, end):
+    # Add the exams dated after the window's end up to the new end
+    for entry in OEPS_Storage.iter_range(datetime.fromisoformat(window["end"]) + timedelta(microseconds=1), end):
+        add_entry(window, entry)
+    window["end"] = end.isoformat()
+
+def refresh(now=None):
+    # Move the window to the WINDOW_DAYS ending now and return it. The lock
+    # keeps saves from adding exams while old ones are being removed.
+    now = now or datetime.now()
+    start = now - timedelta(days=WINDOW_DAYS)
+    with OEPS_Storage.locked():
+        window = load_window()
+        if (window is None or start < datetime.fromisoformat(window["start"]) or now < datetime.fromisoformat(window["end"])
+                or not expire(window, start)):
+            window = build(start, now)
+        else:
+            extend(window, now)
+        save_window(window)
+    return window
+
+def record_entry(entry):
+    record_entries([entry])
+
+def record_entries(entries):
+    # Called by OEPS_Examination.save_entries under the store lock. Exams
+    # dated within the window are appended to its log, so a save costs the
+    # exams saved rather than the whole window. Without a window nothing is
+    # kept; the first refresh builds one.
+    try:
+        with open(WINDOW_LOG_FILE, 'r') as file:
+            header = json.loads(file.readline())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+    if header.get("version") != WINDOW_VERSION:
+        return
+    start, end = period(header)
+    text = "".join(json.dumps(entry) + "\n" for entry in entries if start <= OEPS_Storage.entry_date(entry) <= end)
+    if text:
+        with open(WINDOW_LOG_FILE, 'a') as file:
+            file.write(text)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the rolling 365-day report window.")
+    parser.add_argument("command", choices=["refresh", "rebuild"],
+                        help="refresh: drop exams that have aged out; rebuild: rescan the last 365 days")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        with OEPS_Storage.locked():
+            now = datetime.now()
+            window = build(now - timedelta(days=WINDOW_DAYS), now)
+            save_window(window)
+    else:
+        window = refresh()
+    start, end = period(window)
+    exams = sum(quarter["count"] for quarter in window["quarters"].values())
+    print(f"{exams} exams from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M} in {WINDOW_FILE}.")
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,77 @@
-import subprocess
+import time
+STARTED = time.perf_counter()
+
+import argparse
+import importlib
 import os
+import threading
+
+# Each menu choice runs the matching module's main() in this process, so the
+# interpreter and any libraries already loaded are reused between choices
+MENU_MODULES = {
+    '1': "OEPS_Examination",
+    '2': "OEPS_EXT_Reporting",
+    '3': "OEPS_AR",
+    '4': "OEPS_AR",
+}
+
+# Modules (and the heavy libraries behind them) needed to build reports
+REPORTING_STACK = [
+    "OEPS_Aggregation",
+    "OEPS_Charts",
+    "OEPS_AR",
+    "OEPS_EXT_Reporting",
+    "reportlab.platypus",
+]
 
-def run_script(script_name):
-    if not os.path.exists(script_name):
-        print(f"Required Python script({script_name}) not found. Please reverify installation and try again.")
+# Modules whose main() parses command-line flags; they get an empty argv
+# when run from the menu
+ARGV_MODULES = {"OEPS_AR", "OEPS_EXT_Reporting"}
+
+# Response-time targets, checked when run with --timing
+TARGET_FIRST_PROMPT_SECONDS = 0.5
+TARGET_REPORT_SECONDS = 5.0
+
+def run_module(module_name, timing=False):
+    if not os.path.exists(f"{module_name}.py"):
+        print(f"Required Python script({module_name}.py) not found. Please reverify installation and try again.")
         return
+    started = time.perf_counter()
     try:
-        subprocess.run(["python3", script_name], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred while running {script_name}: {e}")
-        print(f"Return code: {e.returncode}")
-        if e.output:
-            print(f"Output: {e.output.decode()}")
-    except FileNotFoundError:
-        print(f"Error: Python interpreter not found. Ensure Python is installed and in your PATH.")
+        module = importlib.import_module(module_name)
+        if module_name in ARGV_MODULES:
+            module.main([])
+        else:
+            module.main()
+    except SystemExit as e:
+        print(f"{module_name} exited early (status {e.code}).")
+    except ModuleNotFoundError as e:
+        print(f"Error: a required library is missing ({e.name}). Please reverify installation and try again.")
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        
+        print(f"An error occurred while running {module_name}: {e}")
+    if timing:
+        report_time(f"{module_name} finished", time.perf_counter() - started, TARGET_REPORT_SECONDS if module_name != "OEPS_Examination" else None)
+
+def preload_reporting_stack():
+    for module_name in REPORTING_STACK:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            # The missing library is reported properly if a report is requested
+            return
+
+def warm_start():
+    # Import the reporting stack in the background (e.g. while an examiner is
+    # running an exam) so the next report starts without the import cost
+    threading.Thread(target=preload_reporting_stack, daemon=True).start()
+
+def report_time(label, seconds, target=None):
+    if target is None:
+        print(f"[timing] {label} in {seconds:.2f}s")
+    else:
+        status = "within" if seconds <= target else "OVER"
+        print(f"[timing] {label} in {seconds:.2f}s ({status} target of {target:.1f}s)")
+
 def get_valid_input(prompt, options):
     while True:
         choice = input(prompt)
@@ -28,20 +83,27 @@ def get_valid_input(prompt, options):
 
 
 def main(): 
+    parser = argparse.ArgumentParser(description="OEPS examination and reporting menu.")
+    parser.add_argument("--warm-start", action="store_true", help="Preload the reporting libraries in the background")
+    parser.add_argument("--timing", action="store_true", help="Print time-to-first-prompt and time per menu action")
+    args = parser.parse_args()
+
+    first_prompt = True
     while True: 
         print("\n1. Begin new exam")
         print("2. Generate placement report")
         print("3. Generate annual report")
         print("4. Generate x-year")
         print("5. Exit")
+        if args.timing and first_prompt:
+            report_time("First prompt shown", time.perf_counter() - STARTED, TARGET_FIRST_PROMPT_SECONDS)
+            first_prompt = False
         menu_choice = get_valid_input("Please enter the number of your selection here (e.g., 1, 5, etc.): ", ['1', '2', '3', '4', '5'])
 
-        if(menu_choice == '1'):
-            run_script("OEPS_Examination.py")
-        elif(menu_choice == '2'):
-            run_script("OEPS_EXT_Reporting.py")
-        elif(menu_choice == '3' or menu_choice == '4'):
-            run_script("OEPS_AR.py")
+        if(menu_choice == '1' and args.warm_start):
+            warm_start()
+        if(menu_choice in MENU_MODULES):
+            run_module(MENU_MODULES[menu_choice], args.timing)
         elif(menu_choice == '5'):
             break
         else: